@@ -1,49 +1,344 @@
 import bpy
+import importlib
 import math
+import time
+import json
+import cProfile
+from collections import OrderedDict, deque
+from contextlib import nullcontext
 import numpy as np
-import bmesh
 
 # ------------------------------------------------------------------------
-#    Weird Import Stuff
+#    Geometry
 # ------------------------------------------------------------------------
 
-import subprocess
+def load_module(name):
+    # Inside the .blend the sibling scripts live in text blocks, anywhere else
+    # they are regular modules on the import path
+    if (name + ".py" in bpy.data.texts):
+        return bpy.data.texts[name + ".py"].as_module()
+    return importlib.import_module(name)
+
+geometry = load_module("geometry")
+export = load_module("export")
+design = load_module("design")
+
+def fill_polygon_mesh(mesh, verts, loop_totals, loop_verts=None):
+    # Writes polygons into a mesh with foreach_set, replacing its geometry.
+    # Polygon i uses the next loop_totals[i] entries of loop_verts, or of
+    # verts in order when no loop_verts are given. A mesh that already has the
+    # same polygons only gets its vertex coordinates overwritten.
+    if (loop_verts is None):
+        loop_verts = np.arange(len(verts), dtype=np.int32)
+    loop_verts = np.asarray(loop_verts, dtype=np.int32)
+    loop_totals = np.asarray(loop_totals, dtype=np.int32)
+    loop_starts = np.zeros(len(loop_totals), dtype=np.int32)
+    np.cumsum(loop_totals[:-1], out=loop_starts[1:])
+
+    if (len(mesh.vertices) == len(verts) and len(mesh.loops) == len(loop_verts) and len(mesh.polygons) == len(loop_totals)):
+        current_loops = np.empty(len(loop_verts), dtype=np.int32)
+        mesh.loops.foreach_get("vertex_index", current_loops)
+        current_starts = np.empty(len(loop_totals), dtype=np.int32)
+        mesh.polygons.foreach_get("loop_start", current_starts)
+        if (np.array_equal(current_loops, loop_verts) and np.array_equal(current_starts, loop_starts)):
+            mesh.vertices.foreach_set("co", np.ascontiguousarray(verts, dtype=np.float32).ravel())
+            mesh.update()
+            return
+
+    mesh.clear_geometry()
+    mesh.vertices.add(len(verts))
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(verts, dtype=np.float32).ravel())
+    mesh.loops.add(len(loop_verts))
+    mesh.loops.foreach_set("vertex_index", loop_verts)
+    mesh.polygons.add(len(loop_totals))
+    mesh.polygons.foreach_set("loop_start", loop_starts)
+    # loop_total is derived from loop_start from Blender 4.0 on
+    if (bpy.app.version < (4, 0, 0)):
+        mesh.polygons.foreach_set("loop_total", loop_totals)
+    mesh.update(calc_edges=True)
+
+def object_sheet_matrix(obj, sheet_x):
+    # Takes homogeneous local xy coordinates of a pdf preview object onto the
+    # sheet, whose lower left corner sits at x = sheet_x
+    sin = math.sin(obj.rotation_euler.z)
+    cos = math.cos(obj.rotation_euler.z)
+    return np.array([[cos, -sin, obj.location.x - sheet_x],
+                     [sin, cos, obj.location.y],
+                     [0.0, 0.0, 1.0]])
+
+def object_sheet_polygons(obj, sheet_x):
+    # Sheet coordinates of every polygon corner of the object, polygon after
+    # polygon, and the number of corners of each polygon
+    mesh = obj.data
+    coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", coords)
+    loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_verts)
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+
+    points = np.ones((len(loop_verts), 3))
+    points[:, :2] = coords.reshape(-1, 3)[loop_verts, :2]
+    return (points @ object_sheet_matrix(obj, sheet_x).T)[:, :2], loop_totals
+
+def objects_layout(objects, sheet_x):
+    # Sheet translations and rotations of pdf preview objects, one per panel,
+    # in the form of SoccerBall.pdf_translations and pdf_rotations
+    translations = np.zeros((len(objects), 3))
+    rotations = np.zeros((len(objects), 3))
+    count = 0
+    for obj in objects:
+        translations[count] = (obj.location.x - sheet_x, obj.location.y, obj.location.z)
+        rotations[count, 2] = obj.rotation_euler.z
+        count += 1
+    return translations, rotations
+
+def object_sheet_centers(obj, sheet_x):
+    # Sheet coordinates of the center of every polygon of the object
+    mesh = obj.data
+    centers = np.empty(len(mesh.polygons) * 3, dtype=np.float32)
+    mesh.polygons.foreach_get("center", centers)
+
+    points = np.ones((len(mesh.polygons), 3))
+    points[:, :2] = centers.reshape(-1, 3)[:, :2]
+    return (points @ object_sheet_matrix(obj, sheet_x).T)[:, :2]
+
+# ------------------------------------------------------------------------
+#    Geometry Cache
+# ------------------------------------------------------------------------
+
+class GeometryCache:
+    # Least recently used cache of computed geometry arrays. Entries are
+    # evicted once there are more than max_entries of them or their arrays
+    # take more than max_bytes. Cached arrays are read only, as they are
+    # shared by every caller asking for the same key.
+    def __init__(self, max_entries=64, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, compute):
+        if (key in self.entries):
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.misses += 1
+        value = compute()
+
+        size = 0
+        for array in value:
+            if (isinstance(array, np.ndarray)):
+                array.flags.writeable = False
+                size += array.nbytes
+
+        self.entries[key] = value
+        self.sizes[key] = size
+        self.nbytes += size
+
+        while (len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.nbytes > self.max_bytes)):
+            old_key, old_value = self.entries.popitem(last=False)
+            self.nbytes -= self.sizes.pop(old_key)
+            self.evictions += 1
+
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.sizes.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(self.entries), "bytes": self.nbytes}
+
+geometry_cache = GeometryCache()
+
+# ------------------------------------------------------------------------
+#    Mesh Pool
+# ------------------------------------------------------------------------
+
+# Mesh names by role, hole meshes also get their panel index
+MESH_NAMES = {"ball": "Soccer Ball", "face": "Soccer Ball PDF", "lip": "Soccer Ball PDF", "hole": "pdf_hole_", "sheet": "PDF"}
+
+class MeshPool:
+    # Mesh datablocks of the ball and its sheet preview, keyed by role and
+    # panel index. Rebuilds get the same datablock back for the same key and
+    # overwrite it (see fill_polygon_mesh) instead of leaving the old one
+    # behind as orphan data. Meshes only go away through release.
+    def __init__(self):
+        self.meshes = {}
+        self.created = 0
+        self.reused = 0
+
+    def get(self, role, index=0):
+        mesh = self.meshes.get((role, index))
+        if (mesh is not None):
+            try:
+                mesh.name
+                self.reused += 1
+                return mesh
+            except ReferenceError:
+                pass
+
+        mesh = bpy.data.meshes.new(name=MESH_NAMES[role] + (str(index) if role == "hole" else ""))
+        self.meshes[(role, index)] = mesh
+        self.created += 1
+        return mesh
 
-def python_exec():
-    try:
-        path = bpy.app.binary_path_python
-    except AttributeError:
-        import sys
-        path = sys.executable
-    return os.path.abspath(path)
+    def release(self, role, start=0, stop=None):
+        # Removes the role's meshes with start <= index < stop. Meshes still
+        # used by some object are only dropped from the pool.
+        for key in [key for key in self.meshes if key[0] == role and key[1] >= start and (stop is None or key[1] < stop)]:
+            mesh = self.meshes.pop(key)
+            try:
+                if (not mesh.users):
+                    bpy.data.meshes.remove(mesh)
+            except ReferenceError:
+                pass
 
-try:
-    from reportlab.pdfgen import canvas
-except:
-    python_exe = python_exec()
+    def clear(self):
+        for role in set(key[0] for key in self.meshes):
+            self.release(role)
+
+    def stats(self):
+        return {"meshes": len(self.meshes), "created": self.created, "reused": self.reused}
+
+mesh_pool = MeshPool()
+
+# ------------------------------------------------------------------------
+#    Profiling
+# ------------------------------------------------------------------------
 
-    subprocess.call([python_exe, "-m", "ensurepip"])
-    subprocess.call([python_exe, "-m", "pip", "install", "--upgrade", "pip"])
-    subprocess.call([python_exe, "-m", "pip", "install", "reportlab"])
-    from reportlab.pdfgen import canvas
+class StageTimer:
+    __slots__ = ("stages", "name", "start")
+
+    def __init__(self, stages, name):
+        self.stages = stages
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        totals = self.stages.setdefault(self.name, [0.0, 0])
+        totals[0] += time.perf_counter() - self.start
+        totals[1] += 1
+
+class StageProfiler:
+    # Wall time and call count of every stage of the last history rebuilds,
+    # plus the object and mesh counts each rebuild left behind. Turned off,
+    # stage and rebuild hand out one shared do-nothing context manager, so
+    # instrumented code only pays for a method call.
+    def __init__(self, history=32):
+        self.enabled = False
+        self.use_cprofile = False
+        self.history = deque(maxlen=history)
+        self.stages = None
+        self.cprofile = cProfile.Profile()
+        self.idle = nullcontext()
+
+    def stage(self, name):
+        if (self.stages is None):
+            return self.idle
+        return StageTimer(self.stages, name)
+
+    def rebuild(self, kind):
+        if (not self.enabled or self.stages is not None):
+            return self.idle
+        return RebuildRecord(self, kind)
+
+    def last(self):
+        return self.history[-1] if self.history else None
+
+    def averages(self):
+        # Mean milliseconds per rebuild of every stage over the history
+        totals = {}
+        for record in self.history:
+            for name, stage in record["stages"].items():
+                totals[name] = totals.get(name, 0.0) + stage["ms"]
+        return {name: total/len(self.history) for name, total in totals.items()}
+
+    def clear(self):
+        self.history.clear()
+        self.cprofile = cProfile.Profile()
+
+    def write_json(self, file_path):
+        with open(file_path, "w") as f:
+            json.dump({"rebuilds": list(self.history), "averages_ms": self.averages(), "cache": geometry_cache.stats()}, f, indent=1)
+
+    def write_cprofile(self, file_path):
+        self.cprofile.dump_stats(file_path)
+
+class RebuildRecord:
+    __slots__ = ("profiler", "kind", "start")
+
+    def __init__(self, profiler, kind):
+        self.profiler = profiler
+        self.kind = kind
+
+    def __enter__(self):
+        self.profiler.stages = {}
+        if (self.profiler.use_cprofile):
+            self.profiler.cprofile.enable()
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        profiler = self.profiler
+        if (profiler.use_cprofile):
+            profiler.cprofile.disable()
+
+        profiler.history.append({
+            "kind": self.kind,
+            "at": time.time(),
+            "ms": elapsed * 1000,
+            "stages": {name: {"ms": seconds * 1000, "calls": calls} for name, (seconds, calls) in profiler.stages.items()},
+            "objects": len(bpy.data.objects),
+            "meshes": len(bpy.data.meshes),
+        })
+        profiler.stages = None
+
+profiler = StageProfiler()
 
 # ------------------------------------------------------------------------
 #    Soccer Balls
 # ------------------------------------------------------------------------
 
 class SoccerBall:
+    __slots__ = ("unit_verts", "_verts", "edges", "face_offsets", "face_indices",
+                 "verts_pdf", "pdf_offsets", "pdf_corners", "pdf_width", "pdf_height",
+                 "pdf_translations", "pdf_rotations", "radius",
+                 "panel_lip_size", "edge_hole_num", "panel_hole_size")
+
     def __init__(self):
-        self.verts = None
+        # (N, 3) vertices at radius 1, never modified once set. verts scales
+        # them to the current radius.
+        self.unit_verts = None
+        self._verts = None
         self.edges = None
-        self.faces = None
 
+        # Faces in CSR form, face i being face_indices[face_offsets[i]:face_offsets[i + 1]]
+        self.face_offsets = None
+        self.face_indices = None
+
+        # Flattened panel outlines, panel i being verts_pdf[pdf_offsets[i]:pdf_offsets[i + 1]],
+        # and the index in verts_pdf of every face corner, packed like face_indices
         self.verts_pdf = None
-        self.edges_pdf = None
-        self.faces_pdf = None
+        self.pdf_offsets = None
+        self.pdf_corners = None
 
         self.pdf_width = None
         self.pdf_height = None
 
+        # (F, 3) per panel placement on the sheet
         self.pdf_translations = None
         self.pdf_rotations = None
 
@@ -57,145 +352,183 @@ class SoccerBall:
         # Radius
         self.panel_hole_size = None
 
+    @property
+    def verts(self):
+        if (self._verts is None):
+            self._verts = self.unit_verts * self.radius
+            self._verts.flags.writeable = False
+        return self._verts
+
+    @property
+    def panel_count(self):
+        return len(self.face_offsets) - 1
+
     def get_mesh(self):
-        mesh = bpy.data.meshes.new(name="Soccer Ball")
-        mesh.from_pydata(self.verts, self.edges, self.faces)
-        mesh.update()
+        mesh = mesh_pool.get("ball")
+        fill_polygon_mesh(mesh, self.verts, np.diff(self.face_offsets), self.face_indices)
         return mesh
     
     def get_pdf_mesh(self):
         face_meshes = []
         lip_meshes = []
         holes_meshes = []
-        face_index = 0
-        while (face_index < len(self.verts_pdf)):
-            mesh = bpy.data.meshes.new(name="Soccer Ball PDF")
-            mesh.from_pydata(self.verts_pdf[face_index], self.edges_pdf[face_index], self.faces_pdf[face_index])
-            mesh.update()
-            face_meshes.append(mesh)
-
-            # Calculate lip mesh
-            new_verts = []
-            verts = self.verts_pdf[face_index]
-            for vert in verts:
-                vert_len = np.linalg.norm(np.array(vert))
-                wanted_len = vert_len + self.panel_lip_size
-                scale = wanted_len/vert_len
-                new_verts.append(list(np.array(vert) * scale))
-            mesh = bpy.data.meshes.new(name="Soccer Ball PDF")
-            mesh.from_pydata(new_verts, self.edges_pdf[face_index], self.faces_pdf[face_index])
-            mesh.update()
-            lip_meshes.append(mesh)
 
-            # Calculate holes
-            holes = []
-            first_vert = np.array(verts[self.faces_pdf[face_index][0][0]])
-            last_vert = np.array(verts[self.faces_pdf[face_index][0][-1]])
+        face_index = 0
+        while (face_index < len(self.pdf_offsets) - 1):
+            face_meshes.append(mesh_pool.get("face", face_index))
+            lip_meshes.append(mesh_pool.get("lip", face_index))
+            holes_meshes.append(mesh_pool.get("hole", face_index))
+            face_index+=1
 
-            edge = first_vert - last_vert
-            step = np.linalg.norm(edge)/(int(self.edge_hole_num)-1)
-            for i in range(int(self.edge_hole_num)):
-                wanted = i * step
-                scale = wanted/np.linalg.norm(edge)
+        self.fill_pdf_meshes("face", face_meshes)
+        self.fill_pdf_meshes("lip", lip_meshes)
+        self.fill_pdf_meshes("hole", holes_meshes)
 
-                holes.append((edge*scale) + last_vert)
+        pdf_mesh = mesh_pool.get("sheet")
+        self.fill_pdf_sheet_mesh(pdf_mesh)
+        return face_meshes, lip_meshes, holes_meshes, pdf_mesh
 
-            count = 0
-            while count < len(self.faces_pdf[face_index][0]) - 1:
-                first_vert = np.array(verts[self.faces_pdf[face_index][0][count]])
-                last_vert = np.array(verts[self.faces_pdf[face_index][0][count + 1]])
+    def geometry_key(self):
+        # Identifies the ball's topology in geometry_cache keys
+        return (type(self).__name__,)
+
+    def get_pdf_lip_verts(self):
+        def compute():
+            with profiler.stage("lip_outlines"):
+                return (geometry.lip_outlines(self.verts_pdf, self.panel_lip_size),)
+
+        key = ("lip", self.geometry_key(), self.radius, self.panel_lip_size)
+        return geometry_cache.get(key, compute)[0]
+
+    def get_pdf_holes(self):
+        def compute():
+            with profiler.stage("edge_holes"):
+                return geometry.edge_holes(self.verts_pdf, self.pdf_offsets, int(self.edge_hole_num))
+
+        key = ("hole", self.geometry_key(), self.radius, int(self.edge_hole_num))
+        return geometry_cache.get(key, compute)
+
+    def get_pdf_hole_circles(self, segments=16):
+        # Circle vertices of every hole on every panel, panel i owning
+        # circles[hole_offsets[i] * segments:hole_offsets[i + 1] * segments]
+        def compute():
+            holes, hole_offsets = self.get_pdf_holes()
+            with profiler.stage("circle_polygons"):
+                return geometry.circle_polygons(holes, self.panel_hole_size, segments)[0], hole_offsets
+
+        key = ("circle", self.geometry_key(), self.radius, int(self.edge_hole_num), self.panel_hole_size, segments)
+        return geometry_cache.get(key, compute)
+
+    def fill_pdf_meshes(self, part, meshes, first=0):
+        # Rewrites one part ("face", "lip" or "hole") of every panel in place,
+        # one mesh per panel from panel first on, so existing objects keep
+        # their mesh datablocks
+        with profiler.stage("fill_" + part):
+            if (part == "face"):
+                verts = self.verts_pdf
+            elif (part == "lip"):
+                verts = self.get_pdf_lip_verts()
+            else:
+                circles, hole_offsets = self.get_pdf_hole_circles()
+
+            face_index = first
+            for mesh in meshes:
+                if (part == "hole"):
+                    start = hole_offsets[face_index]
+                    end = hole_offsets[face_index + 1]
+                    fill_polygon_mesh(mesh, circles[start * 16:end * 16], np.full(end - start, 16))
+                else:
+                    start = self.pdf_offsets[face_index]
+                    end = self.pdf_offsets[face_index + 1]
+                    fill_polygon_mesh(mesh, verts[start:end], [end - start])
+                face_index+=1
+
+    def sheet_rectangles(self):
+        # (sheets, 4, 3) corners of every sheet of the layout as placed in the
+        # scene, right of the ball
+        pitch = self.pdf_width + geometry.SHEET_SPACING
+        x = self.radius * 2 + np.arange(self.sheet_count()) * pitch
+        verts = np.zeros((len(x), 4, 3))
+        verts[:, :, 0] = x[:, None] + (0, 0, self.pdf_width, self.pdf_width)
+        verts[:, :, 1] = (0, self.pdf_height, self.pdf_height, 0)
+        return verts
+
+    def fill_pdf_sheet_mesh(self, mesh):
+        # One rectangle per sheet of the layout
+        verts = self.sheet_rectangles()
+        fill_polygon_mesh(mesh, verts.reshape(-1, 3), np.full(len(verts), 4))
+
+    def overlay_coords(self, part, hidden=()):
+        # Scene coordinates of one part of the sheet preview as drawn by the
+        # gpu overlay, (n, 3) float32: both ends of every outline edge for
+        # "face", "lip" and "sheet", every hole centre for "hole". Panels in
+        # hidden are left out.
+        with profiler.stage("overlay_" + part):
+            if (part == "sheet"):
+                corners = self.sheet_rectangles().reshape(-1, 3)
+                points = geometry.outline_segments(corners, np.arange(0, len(corners) + 1, 4))
+            else:
+                if (part == "hole"):
+                    points, offsets = self.get_pdf_holes()
+                else:
+                    points = self.verts_pdf if part == "face" else self.get_pdf_lip_verts()
+                    offsets = self.pdf_offsets
+
+                shown = np.ones(self.panel_count, dtype=bool)
+                shown[list(hidden)] = False
+                shown = np.repeat(shown, np.diff(offsets))
+
+                points = geometry.transform_panels(points, offsets, self.pdf_translations, self.pdf_rotations)
+                if (part == "hole"):
+                    points = points[shown]
+                else:
+                    points = geometry.outline_segments(points, offsets)[np.repeat(shown, 2)]
+                points[:, 0] += self.radius * 2
+
+            coords = np.zeros((len(points), 3), dtype=np.float32)
+            coords[:, :2] = points
+            return coords
 
-                edge = first_vert - last_vert
+    def update_pdf_translations(self, translations):
+        self.pdf_translations = np.array(translations, dtype=np.float64).reshape(-1, 3)
 
-                step = np.linalg.norm(edge)/(int(self.edge_hole_num)-1)
-                for i in range(int(self.edge_hole_num)):
-                    wanted = i * step
-                    scale = wanted/np.linalg.norm(edge)
+    def update_pdf_rotations(self, rotations):
+        self.pdf_rotations = np.array(rotations, dtype=np.float64).reshape(-1, 3)
 
-                    holes.append((edge*scale) + last_vert)
-                count+=1
+    def nest_panels(self, gap=2.0):
+        # Lays the lip outlines out automatically on as many sheets as they
+        # need, returns the number of sheets, how many panels are too big for
+        # a sheet and the fraction of the sheets covered by panels
+        translations, rotations, sheets, utilisation = geometry.nest_sheets(self.get_pdf_lip_verts(), self.pdf_offsets, self.pdf_width, self.pdf_height, gap)
+        self.pdf_translations = translations
+        self.pdf_rotations = rotations
+        return int(sheets.max()) + 1, int(np.count_nonzero(sheets < 0)), utilisation
 
-            holes_meshes.append(holes)
+    def sheet_count(self):
+        # Sheets reached by the current layout, laid side by side like in
+        # geometry.nest_sheets
+        if (self.pdf_translations is None or not len(self.pdf_translations)):
+            return 1
+        pitch = self.pdf_width + geometry.SHEET_SPACING
+        return max(int(np.floor(self.pdf_translations[:, 0].max()/pitch)) + 1, 1)
 
-            face_index+=1
+    def update_pdf_mesh(self):
+        if (self.pdf_translations is None):
+            self.pdf_translations = np.zeros((self.panel_count, 3))
+        if (self.pdf_rotations is None):
+            self.pdf_rotations = np.zeros((self.panel_count, 3))
 
-        pdf_mesh = bpy.data.meshes.new(name="PDF")
-        pdf_mesh.from_pydata([[self.radius * 2, 0, 0],[self.radius * 2, self.pdf_height, 0],[self.radius * 2 + self.pdf_width, 0, 0],[self.radius * 2 + self.pdf_width, self.pdf_height, 0]], [], [[0,1,3,2]])
-        pdf_mesh.update()
-        return face_meshes, lip_meshes, holes_meshes, pdf_mesh
+        self.flatten_panels()
 
-    def update_pdf_translations(self, translations):
-        self.pdf_translations = translations
+    def flatten_panels(self):
+        # Panels are flattened once per ball type at unit radius and scaled
+        def compute():
+            with profiler.stage("flatten_faces"):
+                return geometry.flatten_faces(self.unit_verts, self.face_offsets, self.face_indices)[:1]
 
-    def update_pdf_rotations(self, rotations):
-        self.pdf_rotations = rotations
-    
-    def update_pdf_mesh(self):
-        verts_pdf = []
-        edges_pdf = []
-        faces_pdf = []
-
-        if (self.pdf_translations is None):
-            self.pdf_translations = []
-            for face in self.faces:
-                self.pdf_translations.append(np.array([0, 0, 0]))
-
-        for face in self.faces:
-            # Make a vertex the new origin of the polygon
-            translated_face = []
-            base_vert = np.array(list(self.verts[face[0]]))
-            for vert in face:
-                v = np.array(list(self.verts[vert]))
-                trans = v - base_vert
-                translated_face.append(trans)
-        
-            # Rotate the vertices so that it rests on the xy plane
-            v1 = translated_face[1]
-            v2 = translated_face[2]
-
-            normal = np.cross(v1, v2)
-            normal /= np.linalg.norm(normal)
-
-            a = normal
-            b = np.array([0,0,1])
-
-            v = np.cross(a, b)
-            c = np.dot(a, b)
-
-            if (c == -1):
-                c = np.dot(-a, b)
-
-            vx = np.matrix([[0, -v[2], v[1]], [v[2], 0, -v[0]], [-v[1], v[0], 0]])
-
-            rot_matrix = np.eye(3) + vx + (vx @ vx) * (1/(1+c))
-
-            rotated_face = [np.array([0, 0, 0])]
-            vector_sum = np.array([0.0, 0.0, 0.0])
-
-            for vector in translated_face[1:]:
-                rot_v = rot_matrix @ vector
-                rot_v = np.asarray(rot_v).reshape(-1)
-                vector_sum += rot_v
-                rotated_face.append(rot_v)
-
-            centered_face = []
-            for vector in rotated_face:
-                centered_face.append(vector - (vector_sum/len(face)))
-
-            # Add to pdf mesh list
-            verts_pdf.append(list(centered_face))
-            edges_pdf.append([])
-
-            f = []
-            i = 0
-            while i < len(face):
-                f.append(i)
-                i+=1
-            faces_pdf.append([f])
-
-        self.verts_pdf = verts_pdf
-        self.edges_pdf = edges_pdf
-        self.faces_pdf = faces_pdf
+        self.verts_pdf = geometry_cache.get(("flat", self.geometry_key()), compute)[0] * self.radius
+        self.pdf_offsets = self.face_offsets
+        self.pdf_corners = np.arange(len(self.face_indices))
 
     def set_pdf_options(self, width, height, lip, hole_num, hole_size):
         self.pdf_width = width
@@ -206,243 +539,221 @@ class SoccerBall:
 
 
     def update_radius(self, radius):
+        if (radius != self.radius):
+            self._verts = None
         self.radius = radius
 
-        vert = self.verts[0]
-        length = math.sqrt(math.pow(vert[0], 2) + math.pow(vert[1], 2) + math.pow(vert[2], 2))
-        ratio = self.radius/length
+    def design_params(self):
+        # Header fields of the ball's design file, see design.py
+        return {"type": type(self).__name__, "kind": "", "frequency": 0, "radius": self.radius, "tolerance": 0.0,
+                "lip": self.panel_lip_size, "hole_num": self.edge_hole_num, "hole_size": self.panel_hole_size,
+                "pdf_width": self.pdf_width or 0.0, "pdf_height": self.pdf_height or 0.0}
+
+    def import_ball(self, params, arrays):
+        # Takes over a design read by design.load_design. The geometry stays a
+        # view of the memory-mapped file, the layout is copied as it is edited.
+        self.unit_verts = arrays["unit_verts"]
+        self._verts = None
+        self.face_offsets = arrays["face_offsets"]
+        self.face_indices = arrays["face_indices"]
+        self.edges = np.zeros((0, 2), dtype=np.int64)
+
+        self.radius = params["radius"]
+        self.panel_lip_size = params["lip"]
+        self.edge_hole_num = params["hole_num"]
+        self.panel_hole_size = params["hole_size"]
+        self.pdf_width = params["pdf_width"] or None
+        self.pdf_height = params["pdf_height"] or None
+
+        self.pdf_translations = np.array(arrays["pdf_translations"])
+        self.pdf_rotations = np.array(arrays["pdf_rotations"])
+        self.update_pdf_mesh()
 
+    def save_ball(self, file_path):
+        translations = self.pdf_translations if self.pdf_translations is not None else np.zeros((self.panel_count, 3))
+        rotations = self.pdf_rotations if self.pdf_rotations is not None else np.zeros((self.panel_count, 3))
+        design.save_design(file_path, self.design_params(), {
+            "unit_verts": self.unit_verts,
+            "face_offsets": self.face_offsets,
+            "face_indices": self.face_indices,
+            "pdf_translations": translations,
+            "pdf_rotations": rotations,
+        })
+
+    def cutting_pattern(self, outlines, holes):
+        # Gathers the sheet coordinates of every panel's lip outline and hole
+        # centres, keyed by panel index, into the arrays the writers share
+        panel_ids = np.array(sorted(outlines), dtype=np.int64)
+        outline_offsets = np.zeros(len(panel_ids) + 1, dtype=np.int64)
+        hole_offsets = np.zeros(len(panel_ids) + 1, dtype=np.int64)
+        np.cumsum([len(outlines[i]) for i in panel_ids], out=outline_offsets[1:])
+        np.cumsum([len(holes.get(i, ())) for i in panel_ids], out=hole_offsets[1:])
+
+        outline_points = np.concatenate([outlines[i] for i in panel_ids]) if len(panel_ids) else np.zeros((0, 2))
+        hole_points = np.concatenate([holes.get(i, np.zeros((0, 2))) for i in panel_ids]) if len(panel_ids) else np.zeros((0, 2))
+        pages, page_count, outline_points, hole_points = geometry.split_sheets(outline_points, outline_offsets, hole_points, hole_offsets, self.pdf_width)
+
+        return export.CuttingPattern(self.pdf_width, self.pdf_height, outline_points, outline_offsets,
+                                     hole_points, hole_offsets, self.panel_hole_size, pages, panel_ids)
+
+    def layout_pattern(self):
+        # The cutting pattern of the saved layout, for when there are no
+        # preview objects to read it from
+        holes, hole_offsets = self.get_pdf_holes()
+        outlines = geometry.transform_panels(self.get_pdf_lip_verts(), self.pdf_offsets, self.pdf_translations, self.pdf_rotations)
+        holes = geometry.transform_panels(holes, hole_offsets, self.pdf_translations, self.pdf_rotations)
+        pages, page_count, outlines, holes = geometry.split_sheets(outlines, self.pdf_offsets, holes, hole_offsets, self.pdf_width)
+
+        return export.CuttingPattern(self.pdf_width, self.pdf_height, outlines, self.pdf_offsets,
+                                     holes, hole_offsets, self.panel_hole_size, pages)
+
+    def map_uvs(self, mesh, translations=None, rotations=None):
+        # Sets the UV of every loop of the ball mesh (from get_mesh) to where
+        # its panel corner lies on the sheets, each sheet being one UDIM tile.
+        # Works on the mesh data in object mode, the layout defaults to the
+        # saved one.
+        if (translations is None):
+            translations = self.pdf_translations
+        if (rotations is None):
+            rotations = self.pdf_rotations
+
+        points = geometry.transform_panels(self.verts_pdf, self.pdf_offsets, translations, rotations)
+        uvs = geometry.layout_uvs(points, self.pdf_offsets, self.pdf_corners, self.pdf_width, self.pdf_height)
+
+        if (not mesh.uv_layers):
+            mesh.uv_layers.new(name="UVMap")
+        mesh.uv_layers.active.data.foreach_set("uv", uvs.astype(np.float32).ravel())
+        mesh.update()
+
+    def export_pattern(self, panels=None, mesh=None):
+        # The cutting pattern of the pdf preview objects, or of the saved
+        # layout without them, as plain arrays the writers can use away from
+        # Blender data. Maps the ball mesh's UVs to the same layout when a
+        # mesh is given. panels holds the face, lip and hole objects of every
+        # panel in panel order, like sbd's panel registry.
+        if (panels is None):
+            self.update_pdf_mesh()
+            if (mesh is not None):
+                self.map_uvs(mesh)
+            return self.layout_pattern()
+
+        sheet_x = self.radius * 2
+        outlines = {}
+        holes = {}
         count = 0
-        for vert in self.verts:
-            self.verts[count] = (vert[0] * ratio, vert[1] * ratio, vert[2] * ratio)
-            count+=1
-    
-    def import_ball(self):
-        pass
-
-    def save_ball(self):
-        pass
-
-    def export_ball(self, context, file_path, pdf_collection):
-        # SAVE PDF BALL OUTLINE
-        pdf = canvas.Canvas(file_path, pagesize=((self.pdf_width/25.4) * 72, (self.pdf_height/25.4) * 72))
-        pdf.setLineWidth((0.03/25.4) * 72) # 0.03 mm
-
-        obj_uv = context.active_object
-        me_uv = obj_uv.data
-        bm_uv = bmesh.from_edit_mesh(me_uv)
-
-        uv_layer = bm_uv.loops.layers.uv.verify()
-
-        # Loop through panels
-        for child in pdf_collection.children:
-            name_str = child.name.split("_")
-            if (name_str[0] + name_str[1] + name_str[2] == "soccerballpdf"):
-                if (len(name_str) == 4):
-                    for obj in child.objects:
-                        obj_str = obj.name.split("_")
-                        # Draw outline/lip
-                        if (obj_str[0] + obj_str[1] == "pdflip"):
-                            for face in obj.data.polygons:
-                                prev_vert = None
-                                first_vert = None
-                                count = 0
-                                for vert_index in face.vertices:
-                                    sin = math.sin(obj.rotation_euler.z)
-                                    cos = math.cos(obj.rotation_euler.z)
-                                    location = np.array([obj.location.x, obj.location.y, obj.location.z])
-                                    vert = obj.data.vertices[vert_index].co
-                                    x = vert[0] * cos - sin * vert[1]
-                                    y = vert[0] * (sin) + cos * vert[1]
-                                    pdf_vertex = np.array([x, y, vert[2]])
-                                    pdf_vertex = pdf_vertex + location - np.array([self.radius * 2, 0, 0])
-                                    pdf_vertex = (pdf_vertex/25.4) * 72
-                                    if (count == 0):
-                                        first_vert = pdf_vertex
-                                    if (prev_vert is not None):
-                                        pdf.line(prev_vert[0], prev_vert[1], pdf_vertex[0], pdf_vertex[1])
-                                    prev_vert = pdf_vertex
-                                    count+=1
-                                pdf.line(prev_vert[0], prev_vert[1], first_vert[0], first_vert[1])
-
-                        # Map uv coordinates for image texture
-                        if (obj_str[0] + obj_str[1] == "pdfface"):
-                            uv_face = bm_uv.faces[int(obj_str[2])]
-
-                            uv_verts = []
-                            for face in obj.data.polygons:
-                                count = 0
-                                for vert_index in face.vertices:
-                                    sin = math.sin(obj.rotation_euler.z)
-                                    cos = math.cos(obj.rotation_euler.z)
-                                    location = np.array([obj.location.x, obj.location.y, obj.location.z])
-                                    vert = obj.data.vertices[vert_index].co
-                                    x = vert[0] * cos - sin * vert[1]
-                                    y = vert[0] * (sin) + cos * vert[1]
-                                    pdf_vertex = np.array([x, y, vert[2]])
-                                    pdf_vertex = pdf_vertex + location - np.array([self.radius * 2, 0, 0])
-                                    uv_verts.append(pdf_vertex)
-                                    count+=1
-
-                            # adjust uv coordinates
-                            count = 0
-                            for loop in uv_face.loops:
-                                loop_uv = loop[uv_layer]
-
-                                vert = uv_verts[count]
-                                vert/=600
-                                
-                                # use xy position of the vertex as a uv coordinate
-                                loop_uv.uv = (vert[0], vert[1])
-                                count+=1
-  
-                        # Draw holes on outline
-                        elif (obj_str[0] + obj_str[1] == "pdfhole"):
-                            for circle in obj.data.polygons:
-                                sin = math.sin(obj.rotation_euler.z)
-                                cos = math.cos(obj.rotation_euler.z)
-                                location = np.array([obj.location.x, obj.location.y, obj.location.z])
-                                vert = circle.center
-                                x = vert[0] * cos - sin * vert[1]
-                                y = vert[0] * (sin) + cos * vert[1]
-                                center = np.array([x, y, vert[2]])
-                                center = center + location - np.array([self.radius * 2, 0, 0])
-                                center = (center/25.4) * 72
-                                pdf.circle(center[0], center[1], (self.panel_hole_size/25.4) * 72)
-
-        pdf.save()
+        for entry in panels:
+            outlines[count] = object_sheet_polygons(entry.lip, sheet_x)[0]
+            holes[count] = object_sheet_centers(entry.hole, sheet_x)
+            count += 1
 
         # SAVE UV
-        bmesh.update_edit_mesh(me_uv)
-
-
+        if (mesh is not None):
+            self.map_uvs(mesh, *objects_layout([entry.face for entry in panels], sheet_x))
 
+        return self.cutting_pattern(outlines, holes)
 
+    def export_ball(self, file_path, panels=None, mesh=None, page_callback=None):
+        # SAVE CUTTING PATTERN, one page or file per sheet
+        return export.write_pattern(file_path, self.export_pattern(panels, mesh), page_callback)
 
 class PolyhedronBall(SoccerBall):
-    def __init__(self):
-        pass
+    __slots__ = ("kind", "frequency")
 
-class SphericalArcBall(SoccerBall):
-    def __init__(self):
-        pass
-    
-    def import_ball(self):
-        pass
+    # kind and frequency are those of geometry.polyhedron: "goldberg" and
+    # "truncated" balls have 10 * frequency**2 + 2 and 30 * frequency**2 + 2 panels
+    def __init__(self, kind="goldberg", frequency=3):
+        super().__init__()
 
-    def save_ball(self):
-        pass
+        self.kind = kind
+        self.frequency = frequency
 
-    def export_ball(self):
-        pass
+        self.unit_verts, self.face_offsets, self.face_indices = geometry.polyhedron(kind, frequency)
+        self.unit_verts.flags.writeable = False
+        self.edges = np.zeros((0, 2), dtype=np.int64)
 
-class ClassicBall(PolyhedronBall):
-    def __init__(self):
-        self.verts = [(-0.29814159870147705, 0.0, -0.815738320350647), 
-                      (-0.09212832152843475, 0.2835466265678406, -0.815738320350647), 
-                      (0.24119998514652252, 0.17523999512195587, -0.815738320350647), 
-                      (0.24119998514652252, -0.17523999512195587, -0.815738320350647), 
-                      (-0.09212832152843475, -0.2835466265678406, -0.815738320350647), 
-                      (0.7235999703407288, -0.17524001002311707, -0.4472149908542633), 
-                      (0.7805416584014893, -0.35048002004623413, -0.14907169342041016), 
-                      (0.5745283365249634, -0.6340266466140747, -0.14907169342041016), 
-                      (0.3902716636657715, -0.6340266466140747, -0.4472149908542633), 
-                      (0.48240000009536743, -0.35048002004623413, -0.631476640701294), 
-                      (-0.1842566877603531, -0.5670933723449707, -0.631476640701294), 
-                      (0.056943297386169434, -0.7423333525657654, -0.4472149908542633), 
-                      (-0.09212836623191833, -0.8506399989128113, -0.14907169342041016), 
-                      (-0.4254566431045532, -0.7423333525657654, -0.14907169342041016), 
-                      (-0.4823983311653137, -0.5670933723449707, -0.4472149908542633), 
-                      (-0.5962833762168884, 0.0, -0.631476640701294), 
-                      (-0.6884116530418396, -0.28354665637016296, -0.4472149908542633), 
-                      (-0.837483286857605, -0.17523999512195587, -0.14907169342041016), 
-                      (-0.837483286857605, 0.17523999512195587, -0.14907169342041016), 
-                      (-0.6884116530418396, 0.28354665637016296, -0.4472149908542633), 
-                      (-0.1842566877603531, 0.5670933723449707, -0.631476640701294), 
-                      (-0.4823983311653137, 0.5670933723449707, -0.4472149908542633), 
-                      (-0.4254566431045532, 0.7423333525657654, -0.14907169342041016), 
-                      (-0.09212836623191833, 0.8506399989128113, -0.14907169342041016), 
-                      (0.056943297386169434, 0.7423333525657654, -0.4472149908542633), 
-                      (0.7235999703407288, 0.17524001002311707, -0.4472149908542633), 
-                      (0.48240000009536743, 0.35048002004623413, -0.631476640701294), 
-                      (0.3902716636657715, 0.6340266466140747, -0.4472149908542633), 
-                      (0.5745283365249634, 0.6340266466140747, -0.14907169342041016), 
-                      (0.7805416584014893, 0.35048002004623413, -0.14907169342041016), 
-                      (0.09212836623191833, -0.8506399989128113, 0.14907169342041016), 
-                      (0.4254566431045532, -0.7423333525657654, 0.14907169342041016), 
-                      (0.4823983311653137, -0.5670933723449707, 0.4472149908542633), 
-                      (0.1842566877603531, -0.5670933723449707, 0.631476640701294), 
-                      (-0.056943297386169434, -0.7423333525657654, 0.4472149908542633), 
-                      (-0.7805416584014893, -0.35048002004623413, 0.14907169342041016), 
-                      (-0.5745283365249634, -0.6340266466140747, 0.14907169342041016), 
-                      (-0.3902716636657715, -0.6340266466140747, 0.4472149908542633), 
-                      (-0.48240000009536743, -0.35048002004623413, 0.631476640701294), 
-                      (-0.7235999703407288, -0.17524001002311707, 0.4472149908542633), 
-                      (-0.5745283365249634, 0.6340266466140747, 0.14907169342041016), 
-                      (-0.7805416584014893, 0.35048002004623413, 0.14907169342041016), 
-                      (-0.7235999703407288, 0.17524001002311707, 0.4472149908542633), 
-                      (-0.48240000009536743, 0.35048002004623413, 0.631476640701294), 
-                      (-0.3902716636657715, 0.6340266466140747, 0.4472149908542633), 
-                      (0.4254566431045532, 0.7423333525657654, 0.14907169342041016), 
-                      (0.09212836623191833, 0.8506399989128113, 0.14907169342041016), 
-                      (-0.056943297386169434, 0.7423333525657654, 0.4472149908542633), 
-                      (0.1842566877603531, 0.5670933723449707, 0.631476640701294), 
-                      (0.4823983311653137, 0.5670933723449707, 0.4472149908542633), 
-                      (0.837483286857605, -0.17523999512195587, 0.14907169342041016), 
-                      (0.837483286857605, 0.17523999512195587, 0.14907169342041016), 
-                      (0.6884116530418396, 0.28354665637016296, 0.4472149908542633), 
-                      (0.5962833762168884, 0.0, 0.631476640701294), 
-                      (0.6884116530418396, -0.28354665637016296, 0.4472149908542633), 
-                      (0.09212832152843475, -0.2835466265678406, 0.815738320350647), 
-                      (0.29814159870147705, 0.0, 0.815738320350647), 
-                      (0.09212832152843475, 0.2835466265678406, 0.815738320350647), 
-                      (-0.24119998514652252, 0.17523999512195587, 0.815738320350647), 
-                      (-0.24119998514652252, -0.17523999512195587, 0.815738320350647)]
-        
-        self.edges = []
-        self.faces = [[5, 9, 3, 2, 26, 25], 
-                      [1, 0, 15, 19, 21, 20], 
-                      [4, 3, 9, 8, 11, 10], 
-                      [2, 1, 20, 24, 27, 26], 
-                      [12, 11, 8, 7, 31, 30], 
-                      [7, 6, 50, 54, 32, 31], 
-                      [6, 5, 25, 29, 51, 50], 
-                      [13, 12, 30, 34, 37, 36], 
-                      [18, 17, 35, 39, 42, 41], 
-                      [23, 22, 40, 44, 47, 46], 
-                      [17, 16, 14, 13, 36, 35], 
-                      [22, 21, 19, 18, 41, 40], 
-                      [28, 27, 24, 23, 46, 45], 
-                      [29, 28, 45, 49, 52, 51], 
-                      [33, 32, 54, 53, 56, 55], 
-                      [38, 37, 34, 33, 55, 59], 
-                      [43, 42, 39, 38, 59, 58], 
-                      [48, 47, 44, 43, 58, 57], 
-                      [53, 52, 49, 48, 57, 56], 
-                      [0, 1, 2, 3, 4], 
-                      [5, 6, 7, 8, 9], 
-                      [10, 11, 12, 13, 14], 
-                      [15, 16, 17, 18, 19], 
-                      [20, 21, 22, 23, 24], 
-                      [25, 26, 27, 28, 29], 
-                      [30, 31, 32, 33, 34], 
-                      [35, 36, 37, 38, 39], 
-                      [40, 41, 42, 43, 44], 
-                      [45, 46, 47, 48, 49], 
-                      [50, 51, 52, 53, 54], 
-                      [55, 56, 57, 58, 59], 
-                      [0, 4, 10, 14, 16, 15]]
-        
         self.radius = 115
         self.panel_lip_size = 3
         self.edge_hole_num = 9
         self.panel_hole_size = 1
 
-        self.pdf_translations = []
-        self.pdf_rotations = []
-        for face in self.faces:
-            self.pdf_translations.append(np.array([0.0, 0.0, 0.0]))
-            self.pdf_rotations.append(np.array([0.0, 0.0, 0.0]))
+        self.pdf_translations = np.zeros((self.panel_count, 3))
+        self.pdf_rotations = np.zeros((self.panel_count, 3))
 
         self.update_radius(self.radius)
         self.update_pdf_mesh()
+
+    def geometry_key(self):
+        return (type(self).__name__, self.kind, self.frequency)
+
+    def design_params(self):
+        params = super().design_params()
+        params["kind"] = self.kind
+        params["frequency"] = self.frequency
+        return params
+
+    def import_ball(self, params, arrays):
+        self.kind = params["kind"]
+        self.frequency = params["frequency"]
+        super().import_ball(params, arrays)
+
+class SphericalArcBall(PolyhedronBall):
+    __slots__ = ("tolerance", "pdf_arc_offsets")
+
+    # Panels of a polyhedron ball whose seams follow the great circle arcs
+    # between its corners. Every arc is cut into as few chords as keep within
+    # tolerance millimetres of it.
+    def __init__(self, kind="classic", frequency=1, tolerance=0.1):
+        self.tolerance = tolerance
+        self.pdf_arc_offsets = None
+        super().__init__(kind, frequency)
+
+    def geometry_key(self):
+        return (type(self).__name__, self.kind, self.frequency, self.tolerance)
+
+    def design_params(self):
+        params = super().design_params()
+        params["tolerance"] = self.tolerance
+        return params
+
+    def import_ball(self, params, arrays):
+        self.tolerance = params["tolerance"]
+        self.pdf_arc_offsets = None
+        super().import_ball(params, arrays)
+
+    def flatten_panels(self):
+        # Arc sampling depends on the radius, so these are cached per radius
+        def compute():
+            with profiler.stage("flatten_arc_faces"):
+                return geometry.flatten_arc_faces(self.unit_verts, self.face_offsets, self.face_indices, self.radius, self.tolerance)
+
+        self.verts_pdf, self.pdf_offsets, self.pdf_arc_offsets = geometry_cache.get(("arc", self.geometry_key(), self.radius), compute)
+        self.pdf_corners = self.pdf_arc_offsets[:-1]
+
+    def get_pdf_holes(self):
+        def compute():
+            with profiler.stage("arc_holes"):
+                return geometry.arc_holes(self.verts_pdf, self.pdf_arc_offsets, self.face_offsets, int(self.edge_hole_num))
+
+        key = ("hole", self.geometry_key(), self.radius, int(self.edge_hole_num))
+        return geometry_cache.get(key, compute)
+
+class ClassicBall(PolyhedronBall):
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__("classic", 1)
+
+BALL_TYPES = {cls.__name__: cls for cls in (PolyhedronBall, SphericalArcBall, ClassicBall)}
+
+def load_ball(file_path):
+    # Opens a design file written by SoccerBall.save_ball as a ball of the
+    # type it was saved from, without generating its geometry again
+    params, arrays = design.load_design(file_path)
+    if (params["type"] not in BALL_TYPES):
+        raise ValueError("%s holds an unknown ball type %r" % (file_path, params["type"]))
+
+    cls = BALL_TYPES[params["type"]]
+    ball = cls.__new__(cls)
+    SoccerBall.__init__(ball)
+    ball.import_ball(params, arrays)
+    return ball
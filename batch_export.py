@@ -0,0 +1,112 @@
+# Writes cutting pattern PDFs for a list of ball designs without Blender,
+# spread across a process pool:
+#
+#   python batch_export.py designs.json --out-dir patterns --jobs 8
+#
+# designs.json holds a list of designs, for example
+#
+#   [{"name": "size5", "type": "classic", "radius": 110, "lip": 3,
+#     "hole_num": 9, "hole_size": 1, "width": 500, "height": 500}]
+#
+# Any key left out takes its value from DEFAULT_DESIGN. "type" is "classic",
+# "goldberg" or "truncated", the last two generated at the given "frequency"
+# (see geometry.polyhedron). Setting "arc_tolerance" (mm) gives the panels
+# curved seams like SphericalArcBall. "format" is "pdf", "svg" or "dxf"; SVG
+# and DXF patterns get one file per sheet.
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import export
+import geometry
+
+DEFAULT_DESIGN = {
+    "type": "classic",
+    "frequency": 1,
+    "radius": 115,
+    "lip": 3,
+    "hole_num": 9,
+    "hole_size": 1,
+    "width": 500,
+    "height": 500,
+    "arc_tolerance": None,
+    "format": "pdf",
+}
+
+def load_designs(file_path):
+    with open(file_path) as f:
+        specs = json.load(f)
+
+    designs = []
+    count = 0
+    for spec in specs:
+        design = dict(DEFAULT_DESIGN)
+        design["name"] = "design_" + str(count)
+        design.update(spec)
+        designs.append(design)
+        count += 1
+    return designs
+
+def ball_geometry(design):
+    verts, face_offsets, face_indices = geometry.polyhedron(design["type"], design["frequency"])
+    return verts * design["radius"], face_offsets, face_indices
+
+def export_design(design, out_dir):
+    start = time.perf_counter()
+
+    verts, face_offsets, indices = ball_geometry(design)
+    if (design["arc_tolerance"]):
+        verts_pdf, offsets, arc_offsets = geometry.flatten_arc_faces(verts/design["radius"], face_offsets, indices, design["radius"], design["arc_tolerance"])
+        holes, hole_offsets = geometry.arc_holes(verts_pdf, arc_offsets, face_offsets, int(design["hole_num"]))
+    else:
+        offsets = face_offsets
+        verts_pdf = geometry.flatten_faces(verts, offsets, indices)[0]
+        holes, hole_offsets = geometry.edge_holes(verts_pdf, offsets, int(design["hole_num"]))
+    lips = geometry.lip_outlines(verts_pdf, design["lip"])
+
+    translations, rotations, sheets = geometry.nest_sheets(lips, offsets, design["width"], design["height"])[:3]
+    lips = geometry.transform_panels(lips, offsets, translations, rotations)
+    holes = geometry.transform_panels(holes, hole_offsets, translations, rotations)
+    pages, page_count, lips, holes = geometry.split_sheets(lips, offsets, holes, hole_offsets, design["width"])
+    pattern = export.CuttingPattern(design["width"], design["height"], lips, offsets, holes, hole_offsets, design["hole_size"], pages)
+
+    file_paths = export.write_pattern(os.path.join(out_dir, design["name"] + "." + design["format"]), pattern)
+
+    return file_paths, page_count, int(np.count_nonzero(sheets < 0)), time.perf_counter() - start
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Export soccer ball cutting patterns for many designs in parallel")
+    parser.add_argument("designs", help="JSON file with a list of designs")
+    parser.add_argument("--out-dir", default=".", help="directory the PDFs are written to")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    designs = load_designs(args.designs)
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(export_design, design, args.out_dir): design for design in designs}
+        for future in as_completed(futures):
+            design = futures[future]
+            try:
+                file_paths, page_count, oversized, elapsed = future.result()
+            except Exception as error:
+                failed += 1
+                print("%s: failed: %s" % (design["name"], error), file=sys.stderr)
+                continue
+
+            print("%s: %s, %d sheets (%.0f ms)" % (design["name"], ", ".join(file_paths), page_count, elapsed * 1000))
+            if (oversized):
+                print("%s: %d panels are larger than the %gx%g sheet" % (design["name"], oversized, design["width"], design["height"]), file=sys.stderr)
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,321 @@
+# Times every stage of the ball geometry and export pipeline across panel
+# counts, edge hole counts and radii, and writes the results as JSON:
+#
+#   python benchmark.py --output results.json
+#   python benchmark.py --output new.json --compare results.json
+#
+# The geometry stages only need NumPy and run anywhere. The Blender stages
+# (update_radius, update_pdf_mesh, get_pdf_mesh, get_mesh, export_ball) use
+# bpy when it can be imported, either inside Blender or with the pip bpy
+# module:
+#
+#   blender --background --python benchmark.py -- --output results.json
+#
+# Anywhere else they run against a stand-in for the few bpy calls ball.py
+# makes, which keeps mesh data in NumPy arrays. They then time ball.py's own
+# work but none of Blender's, and are only compared with other stand-in runs.
+#
+# With --compare, every timing is matched against the same stage and case
+# in the baseline file, slowdowns beyond --threshold are flagged and the
+# exit code is 1 if there are any.
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+
+# Blender does not put the script's directory on the import path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import design as design_file
+import export
+import geometry
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+# type:frequency of each design, from the 32-panel classic ball up to 3002
+# panels (see geometry.polyhedron)
+DEFAULT_DESIGNS = ["classic:1", "goldberg:3", "goldberg:6", "goldberg:10", "truncated:10"]
+
+SHEET_SIZE = 500
+LIP_SIZE = 3
+HOLE_SIZE = 1
+
+def load_ball_module():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ball.py")
+    spec = importlib.util.spec_from_file_location("ball", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# ------------------------------------------------------------------------
+#    Blender Stand-in
+# ------------------------------------------------------------------------
+
+class StandInCollection:
+    # Mesh vertices, loops or polygons: every property a flat array that
+    # foreach_set and foreach_get copy whole, like Blender's
+    def __init__(self, properties):
+        self.properties = properties
+        self.values = {name: np.zeros(0, dtype=dtype) for name, (dtype, width) in properties.items()}
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, count):
+        self.count += count
+        for name, (dtype, width) in self.properties.items():
+            self.values[name] = np.concatenate([self.values[name], np.zeros(count * width, dtype=dtype)])
+
+    def foreach_set(self, name, values):
+        self.values[name][:] = values
+
+    def foreach_get(self, name, values):
+        values[:] = self.values[name]
+
+class StandInMesh:
+    def __init__(self, name):
+        self.name = name
+        self.users = 0
+        self.clear_geometry()
+
+    def clear_geometry(self):
+        self.vertices = StandInCollection({"co": (np.float32, 3)})
+        self.loops = StandInCollection({"vertex_index": (np.int32, 1)})
+        self.polygons = StandInCollection({"loop_start": (np.int32, 1), "loop_total": (np.int32, 1), "center": (np.float32, 3)})
+
+    def update(self, calc_edges=False):
+        pass
+
+class StandInMeshes(list):
+    def new(self, name):
+        mesh = StandInMesh(name)
+        self.append(mesh)
+        return mesh
+
+    def remove(self, mesh):
+        list.remove(self, mesh)
+
+def stand_in_bpy():
+    # The bpy module as far as ball.py uses it outside of Blender operators
+    module = types.ModuleType("bpy")
+    module.data = types.SimpleNamespace(texts={}, meshes=StandInMeshes(), objects=[])
+    module.app = types.SimpleNamespace(version=(4, 2, 0), version_string="stand-in")
+    return module
+
+def measure(run, repeat, setup=None, teardown=None):
+    # Wall time of every run, setup and teardown not included
+    times = []
+    for i in range(repeat):
+        if (setup is not None):
+            setup()
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - start)
+        if (teardown is not None):
+            teardown(result)
+    return times
+
+# ------------------------------------------------------------------------
+#    Stages
+# ------------------------------------------------------------------------
+
+def geometry_stages(design, frequency, hole_num, radius, repeat, nest_limit, out_dir, shared):
+    # Yields (stage, times) for the bpy-free pipeline batch_export.py runs.
+    # The panel layout it nests is left in shared for blender_stages.
+    state = {}
+
+    def build():
+        verts, offsets, indices = geometry.polyhedron(design, frequency)
+        state["ball"] = verts * radius, offsets, indices
+
+    yield "polyhedron", measure(build, repeat)
+    verts, offsets, indices = state["ball"]
+
+    def flatten():
+        state["pdf"] = geometry.flatten_faces(verts, offsets, indices)[0]
+
+    yield "flatten", measure(flatten, repeat)
+    verts_pdf = state["pdf"]
+
+    def holes():
+        state["holes"] = geometry.edge_holes(verts_pdf, offsets, hole_num)
+
+    yield "holes", measure(holes, repeat)
+    hole_points, hole_offsets = state["holes"]
+
+    def lips():
+        state["lips"] = geometry.lip_outlines(verts_pdf, LIP_SIZE)
+
+    yield "lips", measure(lips, repeat)
+    yield "circles", measure(lambda: geometry.circle_polygons(hole_points, HOLE_SIZE), repeat)
+
+    lip_points = state["lips"]
+    translations = np.zeros((len(offsets) - 1, 3))
+    rotations = np.zeros((len(offsets) - 1, 3))
+    if (len(offsets) - 1 <= nest_limit):
+        def nest():
+            state["layout"] = geometry.nest_sheets(lip_points, offsets, SHEET_SIZE, SHEET_SIZE)[:2]
+
+        yield "nest", measure(nest, repeat)
+        translations, rotations = state["layout"]
+    shared["translations"] = translations
+    shared["rotations"] = rotations
+
+    def layout():
+        lips = geometry.transform_panels(lip_points, offsets, translations, rotations)
+        holes = geometry.transform_panels(hole_points, hole_offsets, translations, rotations)
+        pages, page_count, lips, holes = geometry.split_sheets(lips, offsets, holes, hole_offsets, SHEET_SIZE)
+        state["pattern"] = export.CuttingPattern(SHEET_SIZE, SHEET_SIZE, lips, offsets, holes, hole_offsets, HOLE_SIZE, pages)
+
+    yield "layout", measure(layout, repeat)
+    pattern = state["pattern"]
+
+    design_path = os.path.join(out_dir, "benchmark.sbd")
+    params = {"type": "PolyhedronBall", "kind": design, "frequency": frequency, "radius": radius, "tolerance": 0.0,
+              "lip": LIP_SIZE, "hole_num": hole_num, "hole_size": HOLE_SIZE, "pdf_width": SHEET_SIZE, "pdf_height": SHEET_SIZE}
+    arrays = {"unit_verts": verts/radius, "face_offsets": offsets, "face_indices": indices, "pdf_translations": translations, "pdf_rotations": rotations}
+    yield "save_design", measure(lambda: design_file.save_design(design_path, params, arrays), repeat)
+    yield "load_design", measure(lambda: design_file.load_design(design_path), repeat)
+
+    yield "write_pdf", measure(lambda: export.write_pdf(os.path.join(out_dir, "benchmark.pdf"), pattern), repeat)
+    yield "write_svg", measure(lambda: export.write_svg(os.path.join(out_dir, "benchmark.svg"), pattern), repeat)
+    yield "write_dxf", measure(lambda: export.write_dxf(os.path.join(out_dir, "benchmark.dxf"), pattern), repeat)
+
+def blender_stages(ball_module, design, frequency, hole_num, radius, repeat, shared, out_dir):
+    # Yields (stage, times) for the SoccerBall calls the sidebar makes. The
+    # geometry cache is cleared before every run, so these are cold rebuilds,
+    # while the meshes come back from the mesh pool like they do in the
+    # sidebar. The pool is emptied afterwards. export_ball writes the layout
+    # nested by geometry_stages as a PDF, with the geometry already cached.
+    ball = ball_module.PolyhedronBall(design, frequency)
+    ball.set_pdf_options(SHEET_SIZE, SHEET_SIZE, LIP_SIZE, hole_num, HOLE_SIZE)
+    ball.update_radius(radius)
+    clear = ball_module.geometry_cache.clear
+
+    def update_radius():
+        ball.update_radius(radius + 1)
+        ball.update_radius(radius)
+        return ball.verts
+
+    yield "update_radius", measure(update_radius, repeat)
+    yield "update_pdf_mesh", measure(ball.update_pdf_mesh, repeat, clear)
+    yield "get_pdf_mesh", measure(ball.get_pdf_mesh, repeat, clear)
+    yield "get_mesh", measure(ball.get_mesh, repeat)
+
+    ball.update_pdf_translations(shared["translations"])
+    ball.update_pdf_rotations(shared["rotations"])
+    yield "export_ball", measure(lambda: ball.export_ball(os.path.join(out_dir, "benchmark_ball.pdf")), repeat)
+    ball_module.mesh_pool.clear()
+
+def run_benchmarks(args):
+    global bpy
+    if (bpy is None):
+        bpy = sys.modules["bpy"] = stand_in_bpy()
+    stand_in = bpy.app.version_string == "stand-in"
+    ball_module = load_ball_module()
+    out_dir = tempfile.mkdtemp(prefix="sbd_benchmark_")
+
+    results = []
+    for spec in args.designs:
+        design, frequency = spec.split(":")
+        frequency = int(frequency)
+        panel_count = len(geometry.polyhedron(design, frequency)[1]) - 1
+
+        for hole_num in args.holes:
+            for radius in args.radii:
+                shared = {}
+                stages = [(stage, times, False) for stage, times in geometry_stages(design, frequency, hole_num, radius, args.repeat, args.nest_limit, out_dir, shared)]
+                stages += [(stage, times, stand_in) for stage, times in blender_stages(ball_module, design, frequency, hole_num, radius, args.repeat, shared, out_dir)]
+
+                for stage, times, stage_stand_in in stages:
+                    result = {"stage": stage, "design": design, "frequency": frequency, "panels": panel_count,
+                              "hole_num": hole_num, "radius": radius, "best": min(times), "median": float(np.median(times))}
+                    if (stage_stand_in):
+                        result["stand_in"] = True
+                    results.append(result)
+                    print("%-16s %-10s %6d panels %4d holes/edge r=%-6g %10.2f ms" % (stage, design, panel_count, hole_num, radius, min(times) * 1000))
+
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "blender": bpy.app.version_string,
+        "machine": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+# ------------------------------------------------------------------------
+#    Comparison
+# ------------------------------------------------------------------------
+
+def result_key(result):
+    # Stand-in timings of the Blender stages only match other stand-in ones
+    return (result["stage"], result["design"], result["frequency"], result["hole_num"], result["radius"], result.get("stand_in", False))
+
+def compare(baseline, current, threshold, min_delta):
+    # Prints every stage and case found in both runs, returns the number of
+    # regressions: slower by more than threshold (a fraction) and by more
+    # than min_delta seconds, which keeps millisecond noise out
+    old = {result_key(result): result for result in baseline["results"]}
+
+    regressions = 0
+    print()
+    print("%-16s %-10s %6s %5s %6s %10s %10s %8s" % ("stage", "design", "panels", "holes", "radius", "base ms", "new ms", "change"))
+    for result in current["results"]:
+        previous = old.get(result_key(result))
+        if (previous is None):
+            continue
+
+        change = result["best"]/previous["best"] - 1 if previous["best"] > 0 else 0.0
+        slower = change > threshold and result["best"] - previous["best"] > min_delta
+        if (slower):
+            regressions += 1
+        print("%-16s %-10s %6d %5d %6g %10.2f %10.2f %+7.0f%%%s" % (result["stage"], result["design"], result["panels"], result["hole_num"], result["radius"],
+                                                               previous["best"] * 1000, result["best"] * 1000, change * 100, "  REGRESSION" if slower else ""))
+
+    print()
+    print("%d regressions against the baseline" % regressions)
+    return regressions
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the soccer ball geometry and export pipeline")
+    parser.add_argument("--designs", nargs="+", default=DEFAULT_DESIGNS, help="type:frequency of each ball, e.g. classic:1 goldberg:10")
+    parser.add_argument("--holes", type=int, nargs="+", default=[2, 9], help="edge hole counts")
+    parser.add_argument("--radii", type=float, nargs="+", default=[115], help="ball radii in mm")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the best one counts")
+    parser.add_argument("--nest-limit", type=int, default=150, help="skip nesting above this many panels")
+    parser.add_argument("--output", default="benchmark.json", help="JSON file the results are written to")
+    parser.add_argument("--compare", help="baseline JSON file from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown counted as a regression, as a fraction")
+    parser.add_argument("--min-delta", type=float, default=0.5, help="ignore slowdowns smaller than this many ms")
+    args = parser.parse_args(argv)
+
+    if (bpy is None):
+        print("bpy not found, the Blender stages run against a stand-in")
+
+    current = run_benchmarks(args)
+    with open(args.output, "w") as f:
+        json.dump(current, f, indent=1)
+
+    if (args.compare):
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if (compare(baseline, current, args.threshold, args.min_delta/1000)):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]))
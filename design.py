@@ -0,0 +1,101 @@
+# Soccer ball design files (.sbd). A file is a fixed header, a table of
+# arrays and the raw array data, little endian throughout:
+#
+#   header     magic, format version, ball type, polyhedron kind and
+#              frequency, radius, arc tolerance, lip and hole parameters,
+#              sheet size and the number of arrays
+#   table      name, dtype, shape and file offset of every array
+#   data       every array's bytes, each starting on a 64 byte boundary
+#
+# load_design memory-maps the file and hands out the arrays as read-only
+# views of it, so opening a design costs the same however large it is.
+# save_design writes to a temporary file next to the target and moves it
+# into place, so a design that is still mapped can be saved over.
+
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+MAGIC = b"SBDF"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHH24s16sI7dI")
+ARRAY = struct.Struct("<16s4sIQQQ")
+ALIGNMENT = 64
+
+# Parameters stored in the header, in order after the magic and version
+FLOAT_PARAMS = ("radius", "tolerance", "lip", "hole_num", "hole_size", "pdf_width", "pdf_height")
+
+def aligned(offset):
+    return (offset + ALIGNMENT - 1)//ALIGNMENT * ALIGNMENT
+
+def save_design(file_path, params, arrays):
+    # params holds "type", "kind" and "frequency" plus every name in
+    # FLOAT_PARAMS, arrays maps names of up to 16 characters to 1 or 2
+    # dimensional arrays
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    table = []
+    offset = aligned(HEADER.size + ARRAY.size * len(arrays))
+    for name, array in arrays.items():
+        dtype = array.dtype.newbyteorder("<")
+        shape = array.shape + (0,) * (2 - array.ndim)
+        table.append(ARRAY.pack(name.encode("ascii"), dtype.str.encode("ascii"), array.ndim, shape[0], shape[1], offset))
+        offset = aligned(offset + array.nbytes)
+
+    header = HEADER.pack(MAGIC, VERSION, HEADER.size, params["type"].encode("ascii"), params["kind"].encode("ascii"),
+                         params["frequency"], *[float(params[name]) for name in FLOAT_PARAMS], len(arrays))
+
+    # Truncating a file that is still memory-mapped (the arrays may be views
+    # of the very file being overwritten) kills the process with SIGBUS, so
+    # the old file is replaced rather than rewritten
+    fd, temp_path = tempfile.mkstemp(suffix=".sbd", dir=os.path.dirname(os.path.abspath(file_path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            for entry in table:
+                f.write(entry)
+            for (name, array), entry in zip(arrays.items(), table):
+                f.seek(ARRAY.unpack(entry)[5])
+                f.write(array.astype(array.dtype.newbyteorder("<"), copy=False).tobytes())
+            f.truncate(offset)
+
+        # mkstemp creates the file readable by its owner only
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_path, 0o666 & ~umask)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if (os.path.exists(temp_path)):
+            os.remove(temp_path)
+        raise
+
+def load_design(file_path):
+    # Returns (params, arrays) as given to save_design, the arrays being
+    # read-only views of the memory-mapped file
+    data = np.memmap(file_path, dtype=np.uint8, mode="r")
+    if (len(data) < HEADER.size or bytes(data[:4]) != MAGIC):
+        raise ValueError("%s is not a soccer ball design file" % file_path)
+
+    fields = HEADER.unpack(data[:HEADER.size].tobytes())
+    magic, version, header_size, ball_type, kind, frequency = fields[:6]
+    if (version > VERSION):
+        raise ValueError("%s was saved by a newer version (format %d)" % (file_path, version))
+
+    params = {"type": ball_type.rstrip(b"\0").decode("ascii"), "kind": kind.rstrip(b"\0").decode("ascii"), "frequency": frequency}
+    params.update(zip(FLOAT_PARAMS, fields[6:13]))
+
+    arrays = {}
+    position = header_size
+    for i in range(fields[13]):
+        name, dtype, ndim, rows, columns, offset = ARRAY.unpack(data[position:position + ARRAY.size].tobytes())
+        position += ARRAY.size
+
+        dtype = np.dtype(dtype.rstrip(b"\0").decode("ascii"))
+        shape = (rows, columns)[:ndim]
+        count = int(np.prod(shape))
+        arrays[name.rstrip(b"\0").decode("ascii")] = np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(shape)
+
+    return params, arrays
@@ -0,0 +1,428 @@
+# Cutting file output. Everything here takes panel geometry that is already
+# laid out on the sheet, in millimetres, so export_ball in Blender and
+# batch_export.py share it. Both gather it once into a CuttingPattern, which
+# write_pdf, write_svg and write_dxf all read.
+
+import os
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+POINTS_PER_MM = 72/25.4
+
+# ------------------------------------------------------------------------
+#    Built-in PDF Writer
+# ------------------------------------------------------------------------
+
+# Control point distance of the four Bezier quarters drawing a circle
+CIRCLE_KAPPA = 0.5522847498
+
+# Helvetica advance widths (1/1000 em) of the characters used in labels
+HELVETICA_WIDTHS = {" ": 278, "/": 278, ".": 278, "-": 333, "0": 556, "1": 556, "2": 556, "3": 556, "4": 556,
+                    "5": 556, "6": 556, "7": 556, "8": 556, "9": 556}
+
+def circle_operators(x, y, radius):
+    k = radius * CIRCLE_KAPPA
+    return ("%.3f %.3f m " % (x + radius, y) +
+            "%.3f %.3f %.3f %.3f %.3f %.3f c " % (x + radius, y + k, x + k, y + radius, x, y + radius) +
+            "%.3f %.3f %.3f %.3f %.3f %.3f c " % (x - k, y + radius, x - radius, y + k, x - radius, y) +
+            "%.3f %.3f %.3f %.3f %.3f %.3f c " % (x - radius, y - k, x - k, y - radius, x, y - radius) +
+            "%.3f %.3f %.3f %.3f %.3f %.3f c h" % (x + k, y - radius, x + radius, y - k, x + radius, y))
+
+class PdfPath:
+    __slots__ = ("operators",)
+
+    def __init__(self):
+        self.operators = []
+
+    def moveTo(self, x, y):
+        self.operators.append("%.3f %.3f m" % (x, y))
+
+    def lineTo(self, x, y):
+        self.operators.append("%.3f %.3f l" % (x, y))
+
+    def close(self):
+        self.operators.append("h")
+
+    def circle(self, x, y, radius):
+        self.operators.append(circle_operators(x, y, radius))
+
+class PdfCanvas:
+    # Vector-only stand-in for the part of reportlab's Canvas write_pdf uses:
+    # lines, closed paths, circles and Helvetica text. Every page is
+    # compressed and written to the file by showPage, so only the page being
+    # drawn is held in memory.
+    def __init__(self, file_path, pagesize):
+        self.width, self.height = pagesize
+        self.file = open(file_path, "wb")
+        self.file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+        # Objects 1 to 3 are the catalog, the page tree and the font
+        self.offsets = {}
+        self.next_id = 4
+        self.page_ids = []
+        self.operators = []
+        self.font_size = 12
+        self.write_object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    def write_object(self, object_id, body):
+        self.offsets[object_id] = self.file.tell()
+        self.file.write(b"%d 0 obj\n" % object_id + body + b"\nendobj\n")
+
+    def new_id(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def setLineWidth(self, width):
+        self.operators.append("%.3f w" % width)
+
+    def setFont(self, name, size):
+        # Only Helvetica is embedded
+        self.font_size = size
+
+    def line(self, x1, y1, x2, y2):
+        self.operators.append("%.3f %.3f m %.3f %.3f l S" % (x1, y1, x2, y2))
+
+    def circle(self, x, y, radius, stroke=1, fill=0):
+        self.operators.append(circle_operators(x, y, radius) + " S")
+
+    def beginPath(self):
+        return PdfPath()
+
+    def drawPath(self, path, stroke=1, fill=0):
+        if (path.operators):
+            self.operators.extend(path.operators)
+            self.operators.append("S")
+
+    def drawString(self, x, y, text):
+        text = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        self.operators.append("BT /F1 %.3f Tf %.3f %.3f Td (%s) Tj ET" % (self.font_size, x, y, text))
+
+    def drawCentredString(self, x, y, text):
+        width = sum(HELVETICA_WIDTHS.get(char, 556) for char in text) * self.font_size/1000
+        self.drawString(x - width/2, y, text)
+
+    def showPage(self):
+        content = zlib.compress("\n".join(self.operators).encode("latin-1"))
+        content_id = self.new_id()
+        self.write_object(content_id, b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content) + content + b"\nendstream")
+
+        page_id = self.new_id()
+        self.write_object(page_id, ("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.3f %.3f] /Contents %d 0 R "
+                                    "/Resources << /Font << /F1 3 0 R >> >> >>" % (self.width, self.height, content_id)).encode("latin-1"))
+        self.page_ids.append(page_id)
+        self.operators = []
+
+    def save(self):
+        if (self.operators or not self.page_ids):
+            self.showPage()
+
+        kids = " ".join("%d 0 R" % page_id for page_id in self.page_ids)
+        self.write_object(2, ("<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.page_ids))).encode("latin-1"))
+        self.write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref = self.file.tell()
+        self.file.write(b"xref\n0 %d\n0000000000 65535 f \n" % self.next_id)
+        for object_id in range(1, self.next_id):
+            self.file.write(b"%010d 00000 n \n" % self.offsets[object_id])
+        self.file.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (self.next_id, xref))
+        self.file.close()
+
+def pdf_canvas(file_path, pagesize, backend="builtin"):
+    # "builtin" is PdfCanvas, which writes every page out as it is finished.
+    # reportlab holds every page in memory until save, so it is only used
+    # when backend is "reportlab", and imported on first use, never at
+    # start-up.
+    if (backend == "reportlab"):
+        from reportlab.pdfgen import canvas
+        return canvas.Canvas(file_path, pagesize=pagesize, pageCompression=1)
+    if (backend != "builtin"):
+        raise ValueError("Unknown PDF backend %r" % backend)
+    return PdfCanvas(file_path, pagesize)
+
+# ------------------------------------------------------------------------
+#    Cutting Patterns
+# ------------------------------------------------------------------------
+
+# Registration marks sit this far in from every sheet corner (mm)
+REGISTRATION_INSET = 6
+REGISTRATION_SIZE = 3
+LABEL_SIZE = 4
+
+class CuttingPattern:
+    # Lip outlines and hole centres of every panel, already on their sheet.
+    # Panel i is outlines[outline_offsets[i]:outline_offsets[i + 1]] with the
+    # holes holes[hole_offsets[i]:hole_offsets[i + 1]], lies on page pages[i]
+    # (page 0 when pages is None) and is labelled panel_ids[i].
+    __slots__ = ("width", "height", "outlines", "outline_offsets", "holes", "hole_offsets",
+                 "hole_radius", "pages", "page_count", "panel_ids", "label_points")
+
+    def __init__(self, width, height, outlines, outline_offsets, holes, hole_offsets, hole_radius, pages=None, panel_ids=None):
+        panel_count = len(outline_offsets) - 1
+        self.width = width
+        self.height = height
+        self.outlines = np.asarray(outlines, dtype=np.float64)[:, :2]
+        self.outline_offsets = np.asarray(outline_offsets, dtype=np.int64)
+        self.holes = np.asarray(holes, dtype=np.float64).reshape(-1, 2)
+        self.hole_offsets = np.asarray(hole_offsets, dtype=np.int64)
+        self.hole_radius = hole_radius
+        self.pages = np.zeros(panel_count, dtype=np.int64) if pages is None else np.asarray(pages, dtype=np.int64)
+        self.page_count = int(self.pages.max()) + 1 if panel_count else 1
+        self.panel_ids = np.arange(panel_count) if panel_ids is None else np.asarray(panel_ids)
+
+        # Labels go in the middle of the outline corners
+        self.label_points = np.zeros((panel_count, 2))
+        if (panel_count):
+            self.label_points = np.add.reduceat(self.outlines, self.outline_offsets[:-1])/np.diff(self.outline_offsets)[:, None]
+
+    def page_panels(self):
+        # Yields every page with the indices of its panels, page after page
+        order = np.argsort(self.pages, kind="stable")
+        bounds = np.searchsorted(self.pages[order], np.arange(self.page_count + 1))
+        for page in range(self.page_count):
+            yield page, order[bounds[page]:bounds[page + 1]]
+
+    def registration_marks(self):
+        # Centres of the crossed circles near the sheet corners the sheet is
+        # lined up on the cutter with
+        return [(x, y) for x in (REGISTRATION_INSET, self.width - REGISTRATION_INSET) for y in (REGISTRATION_INSET, self.height - REGISTRATION_INSET)]
+
+    def page_label(self, page):
+        # Sheet number, written next to the lower left registration mark
+        return (REGISTRATION_INSET + REGISTRATION_SIZE * 2, REGISTRATION_INSET), "%d/%d" % (page + 1, self.page_count)
+
+def page_files(file_path, page_count):
+    # Formats without pages get one file per sheet, numbered when there are several
+    if (page_count == 1):
+        return [file_path]
+    stem, extension = os.path.splitext(file_path)
+    return ["%s-%d%s" % (stem, page + 1, extension) for page in range(page_count)]
+
+class ExportCancelled(Exception):
+    # Raised from a page_callback to stop a writer between two sheets
+    pass
+
+def pattern_files(file_path, pattern):
+    # The files write_pattern writes the pattern to
+    if (os.path.splitext(file_path)[1].lower() in (".svg", ".dxf")):
+        return page_files(file_path, pattern.page_count)
+    return [file_path]
+
+def write_pattern(file_path, pattern, page_callback=None, backend="builtin"):
+    # Picks the writer from the file extension, returns the files written.
+    # Everything is written to temporary files next to the targets, which
+    # replace them only once every sheet is done. When page_callback raises,
+    # ExportCancelled or anything else, the temporary files are removed, the
+    # files that were there before are left alone and the exception goes on
+    # to the caller.
+    extension = os.path.splitext(file_path)[1].lower()
+    file_paths = pattern_files(file_path, pattern)
+    fd, temp_path = tempfile.mkstemp(suffix=extension, dir=os.path.dirname(os.path.abspath(file_path)))
+    os.close(fd)
+    temp_paths = pattern_files(temp_path, pattern)
+    try:
+        if (extension == ".svg"):
+            write_svg(temp_path, pattern, page_callback)
+        elif (extension == ".dxf"):
+            write_dxf(temp_path, pattern, page_callback)
+        else:
+            write_pdf(temp_path, pattern, page_callback, backend)
+
+        # mkstemp creates files readable by their owner only
+        umask = os.umask(0)
+        os.umask(umask)
+        for temp, path in zip(temp_paths, file_paths):
+            os.chmod(temp, 0o666 & ~umask)
+            os.replace(temp, path)
+    finally:
+        for path in set(temp_paths + [temp_path]):
+            if (os.path.exists(path)):
+                os.remove(path)
+    return file_paths
+
+# ------------------------------------------------------------------------
+#    PDF
+# ------------------------------------------------------------------------
+
+def write_pdf(file_path, pattern, page_callback=None, backend="builtin"):
+    # One page per sheet, drawn one at a time. page_callback(page,
+    # page_count, seconds) is called after each of them. backend is
+    # "builtin" or "reportlab" (see pdf_canvas).
+    pdf = pdf_canvas(file_path, (pattern.width * POINTS_PER_MM, pattern.height * POINTS_PER_MM), backend)
+
+    # Plain floats format much faster than NumPy scalars
+    points = (pattern.outlines * POINTS_PER_MM).tolist()
+    hole_points = (pattern.holes * POINTS_PER_MM).tolist()
+    label_points = (pattern.label_points * POINTS_PER_MM).tolist()
+    offsets = pattern.outline_offsets.tolist()
+    hole_offsets = pattern.hole_offsets.tolist()
+    hole_radius = pattern.hole_radius * POINTS_PER_MM
+    mark_size = REGISTRATION_SIZE * POINTS_PER_MM
+
+    try:
+        for page, panels in pattern.page_panels():
+            start = time.perf_counter()
+
+            # Canvas state is reset by every showPage
+            pdf.setLineWidth(0.03 * POINTS_PER_MM) # 0.03 mm
+            pdf.setFont("Helvetica", LABEL_SIZE * POINTS_PER_MM)
+
+            for x, y in pattern.registration_marks():
+                x *= POINTS_PER_MM
+                y *= POINTS_PER_MM
+                pdf.line(x - mark_size, y, x + mark_size, y)
+                pdf.line(x, y - mark_size, x, y + mark_size)
+                pdf.circle(x, y, mark_size * 0.6, stroke=1, fill=0)
+            (x, y), text = pattern.page_label(page)
+            pdf.drawString(x * POINTS_PER_MM, (y - LABEL_SIZE/3) * POINTS_PER_MM, text)
+
+            # One closed path per panel outline, its id in the middle
+            for panel in panels.tolist():
+                corners = points[offsets[panel]:offsets[panel + 1]]
+                path = pdf.beginPath()
+                path.moveTo(*corners[0])
+                for x, y in corners[1:]:
+                    path.lineTo(x, y)
+                path.close()
+                pdf.drawPath(path, stroke=1, fill=0)
+
+                x, y = label_points[panel]
+                pdf.drawCentredString(x, y - LABEL_SIZE/3 * POINTS_PER_MM, str(pattern.panel_ids[panel]))
+
+            # Every hole on the page in a single path
+            path = pdf.beginPath()
+            for panel in panels.tolist():
+                for x, y in hole_points[hole_offsets[panel]:hole_offsets[panel + 1]]:
+                    path.circle(x, y, hole_radius)
+            pdf.drawPath(path, stroke=1, fill=0)
+
+            pdf.showPage()
+            if (page_callback is not None):
+                page_callback(page, pattern.page_count, time.perf_counter() - start)
+    except BaseException:
+        # reportlab only opens the file on save, the built-in writer at once
+        if (isinstance(pdf, PdfCanvas)):
+            pdf.file.close()
+        raise
+
+    pdf.save()
+    return [file_path]
+
+# ------------------------------------------------------------------------
+#    SVG
+# ------------------------------------------------------------------------
+
+def write_svg(file_path, pattern, page_callback=None):
+    # One SVG per sheet in millimetres, with the panels as polygons, the holes
+    # as circles and the registration marks and labels in their own group.
+    # SVG's y axis points down, so y is flipped on the way out.
+    file_paths = page_files(file_path, pattern.page_count)
+    offsets = pattern.outline_offsets.tolist()
+    hole_offsets = pattern.hole_offsets.tolist()
+    height = pattern.height
+
+    flipped = pattern.outlines * (1, -1) + (0, height)
+    flipped_holes = (pattern.holes * (1, -1) + (0, height)).tolist()
+    label_points = (pattern.label_points * (1, -1) + (0, height + LABEL_SIZE/3)).tolist()
+
+    for page, panels in pattern.page_panels():
+        start = time.perf_counter()
+        with open(file_paths[page], "w") as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write('<svg xmlns="http://www.w3.org/2000/svg" width="%gmm" height="%gmm" viewBox="0 0 %g %g">\n' % (pattern.width, height, pattern.width, height))
+
+            f.write('<g id="outlines" fill="none" stroke="#ff0000" stroke-width="0.03">\n')
+            for panel in panels.tolist():
+                corners = flipped[offsets[panel]:offsets[panel + 1]]
+                f.write('<polygon id="panel-%s" points="%s"/>\n' % (pattern.panel_ids[panel], " ".join("%.3f,%.3f" % (x, y) for x, y in corners.tolist())))
+            f.write('</g>\n')
+
+            f.write('<g id="holes" fill="none" stroke="#ff0000" stroke-width="0.03">\n')
+            for panel in panels.tolist():
+                for x, y in flipped_holes[hole_offsets[panel]:hole_offsets[panel + 1]]:
+                    f.write('<circle cx="%.3f" cy="%.3f" r="%g"/>\n' % (x, y, pattern.hole_radius))
+            f.write('</g>\n')
+
+            f.write('<g id="marks" fill="none" stroke="#0000ff" stroke-width="0.03">\n')
+            for x, y in pattern.registration_marks():
+                y = height - y
+                f.write('<path d="M%g %gH%gM%g %gV%g"/>\n' % (x - REGISTRATION_SIZE, y, x + REGISTRATION_SIZE, x, y - REGISTRATION_SIZE, y + REGISTRATION_SIZE))
+                f.write('<circle cx="%g" cy="%g" r="%g"/>\n' % (x, y, REGISTRATION_SIZE * 0.6))
+            f.write('</g>\n')
+
+            f.write('<g id="labels" fill="#0000ff" font-family="Helvetica, Arial, sans-serif" font-size="%g" text-anchor="middle">\n' % LABEL_SIZE)
+            (x, y), text = pattern.page_label(page)
+            f.write('<text x="%g" y="%g" text-anchor="start">%s</text>\n' % (x, height - y + LABEL_SIZE/3, text))
+            for panel in panels.tolist():
+                x, y = label_points[panel]
+                f.write('<text x="%.3f" y="%.3f">%s</text>\n' % (x, y, pattern.panel_ids[panel]))
+            f.write('</g>\n')
+            f.write('</svg>\n')
+
+        if (page_callback is not None):
+            page_callback(page, pattern.page_count, time.perf_counter() - start)
+    return file_paths
+
+# ------------------------------------------------------------------------
+#    DXF
+# ------------------------------------------------------------------------
+
+# Every entity is written as (group code, value) lines. The files are
+# AutoCAD R12 (AC1009), which every cutter and CAM program reads. R12 has no
+# units, the drawing is in millimetres.
+
+def dxf_polyline(f, layer, corners):
+    f.write("0\nPOLYLINE\n8\n%s\n66\n1\n70\n1\n" % layer)
+    for x, y in corners:
+        f.write("0\nVERTEX\n8\n%s\n10\n%.4f\n20\n%.4f\n" % (layer, x, y))
+    f.write("0\nSEQEND\n8\n%s\n" % layer)
+
+def dxf_circle(f, layer, x, y, radius):
+    f.write("0\nCIRCLE\n8\n%s\n10\n%.4f\n20\n%.4f\n40\n%.4f\n" % (layer, x, y, radius))
+
+def dxf_text(f, layer, x, y, height, text, centered=False):
+    if (centered):
+        f.write("0\nTEXT\n8\n%s\n10\n%.4f\n20\n%.4f\n40\n%g\n1\n%s\n72\n1\n73\n2\n11\n%.4f\n21\n%.4f\n" % (layer, x, y, height, text, x, y))
+    else:
+        f.write("0\nTEXT\n8\n%s\n10\n%.4f\n20\n%.4f\n40\n%g\n1\n%s\n" % (layer, x, y, height, text))
+
+def write_dxf(file_path, pattern, page_callback=None):
+    # One DXF per sheet: closed polylines on layer CUT, hole circles on layer
+    # HOLES, registration marks and labels on layers MARKS and LABELS
+    file_paths = page_files(file_path, pattern.page_count)
+    points = pattern.outlines.tolist()
+    hole_points = pattern.holes.tolist()
+    label_points = pattern.label_points.tolist()
+    offsets = pattern.outline_offsets.tolist()
+    hole_offsets = pattern.hole_offsets.tolist()
+
+    for page, panels in pattern.page_panels():
+        start = time.perf_counter()
+        with open(file_paths[page], "w") as f:
+            f.write("0\nSECTION\n2\nHEADER\n9\n$ACADVER\n1\nAC1009\n9\n$EXTMIN\n10\n0\n20\n0\n9\n$EXTMAX\n10\n%g\n20\n%g\n0\nENDSEC\n" % (pattern.width, pattern.height))
+            f.write("0\nSECTION\n2\nENTITIES\n")
+
+            for panel in panels.tolist():
+                dxf_polyline(f, "CUT", points[offsets[panel]:offsets[panel + 1]])
+            for panel in panels.tolist():
+                for x, y in hole_points[hole_offsets[panel]:hole_offsets[panel + 1]]:
+                    dxf_circle(f, "HOLES", x, y, pattern.hole_radius)
+
+            for x, y in pattern.registration_marks():
+                f.write("0\nLINE\n8\nMARKS\n10\n%g\n20\n%g\n11\n%g\n21\n%g\n" % (x - REGISTRATION_SIZE, y, x + REGISTRATION_SIZE, y))
+                f.write("0\nLINE\n8\nMARKS\n10\n%g\n20\n%g\n11\n%g\n21\n%g\n" % (x, y - REGISTRATION_SIZE, x, y + REGISTRATION_SIZE))
+                dxf_circle(f, "MARKS", x, y, REGISTRATION_SIZE * 0.6)
+
+            (x, y), text = pattern.page_label(page)
+            dxf_text(f, "LABELS", x, y - LABEL_SIZE/3, LABEL_SIZE, text)
+            for panel in panels.tolist():
+                x, y = label_points[panel]
+                dxf_text(f, "LABELS", x, y, LABEL_SIZE, str(pattern.panel_ids[panel]), centered=True)
+
+            f.write("0\nENDSEC\n0\nEOF\n")
+
+        if (page_callback is not None):
+            page_callback(page, pattern.page_count, time.perf_counter() - start)
+    return file_paths
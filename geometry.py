@@ -0,0 +1,902 @@
+# Ball geometry with no Blender dependency: flattening the faces of a ball
+# into panels, panel lips and seam holes, and laying panels out on a sheet.
+# ball.py builds Blender meshes from it and batch_export.py uses it headless.
+
+import math
+import numpy as np
+
+# ------------------------------------------------------------------------
+#    Ball Types
+# ------------------------------------------------------------------------
+
+# Truncated icosahedron, 12 pentagons and 20 hexagons
+CLASSIC_VERTS = [(-0.29814159870147705, 0.0, -0.815738320350647),
+                 (-0.09212832152843475, 0.2835466265678406, -0.815738320350647),
+                 (0.24119998514652252, 0.17523999512195587, -0.815738320350647),
+                 (0.24119998514652252, -0.17523999512195587, -0.815738320350647),
+                 (-0.09212832152843475, -0.2835466265678406, -0.815738320350647),
+                 (0.7235999703407288, -0.17524001002311707, -0.4472149908542633),
+                 (0.7805416584014893, -0.35048002004623413, -0.14907169342041016),
+                 (0.5745283365249634, -0.6340266466140747, -0.14907169342041016),
+                 (0.3902716636657715, -0.6340266466140747, -0.4472149908542633),
+                 (0.48240000009536743, -0.35048002004623413, -0.631476640701294),
+                 (-0.1842566877603531, -0.5670933723449707, -0.631476640701294),
+                 (0.056943297386169434, -0.7423333525657654, -0.4472149908542633),
+                 (-0.09212836623191833, -0.8506399989128113, -0.14907169342041016),
+                 (-0.4254566431045532, -0.7423333525657654, -0.14907169342041016),
+                 (-0.4823983311653137, -0.5670933723449707, -0.4472149908542633),
+                 (-0.5962833762168884, 0.0, -0.631476640701294),
+                 (-0.6884116530418396, -0.28354665637016296, -0.4472149908542633),
+                 (-0.837483286857605, -0.17523999512195587, -0.14907169342041016),
+                 (-0.837483286857605, 0.17523999512195587, -0.14907169342041016),
+                 (-0.6884116530418396, 0.28354665637016296, -0.4472149908542633),
+                 (-0.1842566877603531, 0.5670933723449707, -0.631476640701294),
+                 (-0.4823983311653137, 0.5670933723449707, -0.4472149908542633),
+                 (-0.4254566431045532, 0.7423333525657654, -0.14907169342041016),
+                 (-0.09212836623191833, 0.8506399989128113, -0.14907169342041016),
+                 (0.056943297386169434, 0.7423333525657654, -0.4472149908542633),
+                 (0.7235999703407288, 0.17524001002311707, -0.4472149908542633),
+                 (0.48240000009536743, 0.35048002004623413, -0.631476640701294),
+                 (0.3902716636657715, 0.6340266466140747, -0.4472149908542633),
+                 (0.5745283365249634, 0.6340266466140747, -0.14907169342041016),
+                 (0.7805416584014893, 0.35048002004623413, -0.14907169342041016),
+                 (0.09212836623191833, -0.8506399989128113, 0.14907169342041016),
+                 (0.4254566431045532, -0.7423333525657654, 0.14907169342041016),
+                 (0.4823983311653137, -0.5670933723449707, 0.4472149908542633),
+                 (0.1842566877603531, -0.5670933723449707, 0.631476640701294),
+                 (-0.056943297386169434, -0.7423333525657654, 0.4472149908542633),
+                 (-0.7805416584014893, -0.35048002004623413, 0.14907169342041016),
+                 (-0.5745283365249634, -0.6340266466140747, 0.14907169342041016),
+                 (-0.3902716636657715, -0.6340266466140747, 0.4472149908542633),
+                 (-0.48240000009536743, -0.35048002004623413, 0.631476640701294),
+                 (-0.7235999703407288, -0.17524001002311707, 0.4472149908542633),
+                 (-0.5745283365249634, 0.6340266466140747, 0.14907169342041016),
+                 (-0.7805416584014893, 0.35048002004623413, 0.14907169342041016),
+                 (-0.7235999703407288, 0.17524001002311707, 0.4472149908542633),
+                 (-0.48240000009536743, 0.35048002004623413, 0.631476640701294),
+                 (-0.3902716636657715, 0.6340266466140747, 0.4472149908542633),
+                 (0.4254566431045532, 0.7423333525657654, 0.14907169342041016),
+                 (0.09212836623191833, 0.8506399989128113, 0.14907169342041016),
+                 (-0.056943297386169434, 0.7423333525657654, 0.4472149908542633),
+                 (0.1842566877603531, 0.5670933723449707, 0.631476640701294),
+                 (0.4823983311653137, 0.5670933723449707, 0.4472149908542633),
+                 (0.837483286857605, -0.17523999512195587, 0.14907169342041016),
+                 (0.837483286857605, 0.17523999512195587, 0.14907169342041016),
+                 (0.6884116530418396, 0.28354665637016296, 0.4472149908542633),
+                 (0.5962833762168884, 0.0, 0.631476640701294),
+                 (0.6884116530418396, -0.28354665637016296, 0.4472149908542633),
+                 (0.09212832152843475, -0.2835466265678406, 0.815738320350647),
+                 (0.29814159870147705, 0.0, 0.815738320350647),
+                 (0.09212832152843475, 0.2835466265678406, 0.815738320350647),
+                 (-0.24119998514652252, 0.17523999512195587, 0.815738320350647),
+                 (-0.24119998514652252, -0.17523999512195587, 0.815738320350647)]
+
+CLASSIC_FACES = [[5, 9, 3, 2, 26, 25],
+                 [1, 0, 15, 19, 21, 20],
+                 [4, 3, 9, 8, 11, 10],
+                 [2, 1, 20, 24, 27, 26],
+                 [12, 11, 8, 7, 31, 30],
+                 [7, 6, 50, 54, 32, 31],
+                 [6, 5, 25, 29, 51, 50],
+                 [13, 12, 30, 34, 37, 36],
+                 [18, 17, 35, 39, 42, 41],
+                 [23, 22, 40, 44, 47, 46],
+                 [17, 16, 14, 13, 36, 35],
+                 [22, 21, 19, 18, 41, 40],
+                 [28, 27, 24, 23, 46, 45],
+                 [29, 28, 45, 49, 52, 51],
+                 [33, 32, 54, 53, 56, 55],
+                 [38, 37, 34, 33, 55, 59],
+                 [43, 42, 39, 38, 59, 58],
+                 [48, 47, 44, 43, 58, 57],
+                 [53, 52, 49, 48, 57, 56],
+                 [0, 1, 2, 3, 4],
+                 [5, 6, 7, 8, 9],
+                 [10, 11, 12, 13, 14],
+                 [15, 16, 17, 18, 19],
+                 [20, 21, 22, 23, 24],
+                 [25, 26, 27, 28, 29],
+                 [30, 31, 32, 33, 34],
+                 [35, 36, 37, 38, 39],
+                 [40, 41, 42, 43, 44],
+                 [45, 46, 47, 48, 49],
+                 [50, 51, 52, 53, 54],
+                 [55, 56, 57, 58, 59],
+                 [0, 4, 10, 14, 16, 15]]
+
+# ------------------------------------------------------------------------
+#    Polyhedron Generation
+# ------------------------------------------------------------------------
+
+def icosahedron():
+    phi = (1 + math.sqrt(5))/2
+    verts = np.array([(-1, phi, 0), (1, phi, 0), (-1, -phi, 0), (1, -phi, 0),
+                      (0, -1, phi), (0, 1, phi), (0, -1, -phi), (0, 1, -phi),
+                      (phi, 0, -1), (phi, 0, 1), (-phi, 0, -1), (-phi, 0, 1)])
+    triangles = np.array([(0, 11, 5), (0, 5, 1), (0, 1, 7), (0, 7, 10), (0, 10, 11),
+                          (1, 5, 9), (5, 11, 4), (11, 10, 2), (10, 7, 6), (7, 1, 8),
+                          (3, 9, 4), (3, 4, 2), (3, 2, 6), (3, 6, 8), (3, 8, 9),
+                          (4, 9, 5), (2, 4, 11), (6, 2, 10), (8, 6, 7), (9, 8, 1)])
+    return verts/np.linalg.norm(verts, axis=1)[:, None], triangles
+
+def merge_points(points, tolerance=1e-6):
+    # Merges coincident points by hashing their positions snapped to a grid
+    # of the given spacing. Returns the unique points and, for every input
+    # point, the index of the unique point it became.
+    snapped = np.round(points/tolerance).astype(np.int64)
+    snapped -= snapped.min(axis=0)
+    bits = max(int(snapped.max()).bit_length(), 1)
+    if (bits * 3 > 63):
+        raise ValueError("Points span too large a range for the merge tolerance")
+
+    keys = (snapped[:, 0] << (2 * bits)) | (snapped[:, 1] << bits) | snapped[:, 2]
+    unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return points[first], inverse.ravel()
+
+def subdivide_triangles(verts, triangles, frequency):
+    # Splits every triangle into frequency**2 triangles on a barycentric grid,
+    # projects the new vertices onto the unit sphere and merges the vertices
+    # shared along the original edges
+    n = frequency
+    i, j = np.triu_indices(n + 1)
+    j = j - i
+    grid = np.stack([n - i - j, i, j], axis=1)/n
+    keep = grid[:, 0] >= 0
+    grid = grid[keep]
+    i = i[keep]
+    j = j[keep]
+
+    # Position of barycentric point (i, j) in the grid
+    index = np.full((n + 1, n + 1), -1)
+    index[i, j] = np.arange(len(grid))
+
+    up_i, up_j = np.nonzero((np.add.outer(np.arange(n + 1), np.arange(n + 1)) < n))
+    up = np.stack([index[up_i, up_j], index[up_i + 1, up_j], index[up_i, up_j + 1]], axis=1)
+    down_i, down_j = np.nonzero((np.add.outer(np.arange(n + 1), np.arange(n + 1)) < n - 1))
+    down = np.stack([index[down_i + 1, down_j], index[down_i + 1, down_j + 1], index[down_i, down_j + 1]], axis=1)
+    local = np.concatenate([up, down])
+
+    points = np.einsum("pk,tkd->tpd", grid, verts[triangles]).reshape(-1, 3)
+    new_triangles = (local[None, :, :] + (np.arange(len(triangles)) * len(grid))[:, None, None]).reshape(-1, 3)
+
+    points, inverse = merge_points(points)
+    points /= np.linalg.norm(points, axis=1)[:, None]
+    return points, inverse[new_triangles]
+
+def orient_outward(verts, offsets, indices):
+    # Reverses the faces whose normals point into the sphere
+    starts = offsets[:-1]
+    face_verts = verts[indices]
+    normals = np.cross(face_verts[starts + 1] - face_verts[starts], face_verts[starts + 2] - face_verts[starts])
+    centroids = np.add.reduceat(face_verts, starts)
+    inward = np.einsum("ij,ij->i", normals, centroids) < 0
+
+    sizes = np.diff(offsets)
+    face_of_vert = np.repeat(np.arange(len(sizes)), sizes)
+    local = np.arange(len(indices)) - starts[face_of_vert]
+    flipped = np.where(inward[face_of_vert], offsets[1:][face_of_vert] - 1 - local, np.arange(len(indices)))
+    return indices[flipped]
+
+def dual_polyhedron(verts, offsets, indices):
+    # Each face becomes a vertex on the unit sphere, and each vertex becomes a
+    # face joining the faces around it, ordered counterclockwise seen from
+    # outside
+    sizes = np.diff(offsets)
+    face_of_vert = np.repeat(np.arange(len(sizes)), sizes)
+    centers = np.add.reduceat(verts[indices], offsets[:-1])
+    centers /= np.linalg.norm(centers, axis=1)[:, None]
+
+    # Tangent frame at every vertex to measure angles around it in
+    normals = verts/np.linalg.norm(verts, axis=1)[:, None]
+    helper = np.where(np.abs(normals[:, :1]) < 0.9, [[1.0, 0.0, 0.0]], [[0.0, 1.0, 0.0]])
+    e1 = np.cross(normals, helper)
+    e1 /= np.linalg.norm(e1, axis=1)[:, None]
+    e2 = np.cross(normals, e1)
+
+    d = centers[face_of_vert] - verts[indices]
+    angles = np.arctan2(np.einsum("ij,ij->i", d, e2[indices]), np.einsum("ij,ij->i", d, e1[indices]))
+    order = np.lexsort((angles, indices))
+
+    dual_offsets = np.zeros(len(verts) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=len(verts)), out=dual_offsets[1:])
+    return centers, dual_offsets, face_of_vert[order].astype(np.int64)
+
+def polyhedron(kind, frequency=1):
+    # Unit sphere vertices and CSR faces of a ball:
+    #   "classic"   the truncated icosahedron of ClassicBall (frequency unused)
+    #   "goldberg"  Goldberg polyhedron GP(frequency, 0), 10 * frequency**2 + 2 panels
+    #   "truncated" subdivided truncated icosahedron GP(frequency, frequency),
+    #               30 * frequency**2 + 2 panels, frequency 1 being the classic ball
+    if (kind == "classic"):
+        verts = np.array(CLASSIC_VERTS)
+        offsets, indices = faces_to_csr(CLASSIC_FACES)
+        return verts/np.linalg.norm(verts[0]), offsets, indices
+
+    if (kind == "goldberg"):
+        verts, triangles = icosahedron()
+    elif (kind == "truncated"):
+        # The pentakis dodecahedron, dual of the truncated icosahedron
+        verts, offsets, indices = polyhedron("classic")
+        verts, offsets, indices = dual_polyhedron(verts, offsets, orient_outward(verts, offsets, indices))
+        triangles = indices.reshape(-1, 3)
+    else:
+        raise ValueError("Unknown polyhedron kind: " + str(kind))
+
+    verts, triangles = subdivide_triangles(verts, triangles, int(frequency))
+    offsets = np.arange(0, len(triangles) * 3 + 1, 3, dtype=np.int64)
+    indices = orient_outward(verts, offsets, triangles.ravel())
+    return dual_polyhedron(verts, offsets, indices)
+
+# ------------------------------------------------------------------------
+#    Panels
+# ------------------------------------------------------------------------
+
+def rotations_to_z(normals):
+    # Rodrigues rotation matrices taking each unit normal onto +Z. Normals
+    # pointing down are first given a half turn about X so that 1 + c never
+    # gets near zero (a normal of exactly -Z has no unique rotation axis).
+    flip = normals[:, 2] < 0
+    n = normals.copy()
+    n[flip, 1:] *= -1
+
+    x = n[:, 0]
+    y = n[:, 1]
+    k = 1/(1 + n[:, 2])
+
+    rotations = np.empty((len(n), 3, 3))
+    rotations[:, 0, 0] = 1 - x * x * k
+    rotations[:, 0, 1] = -x * y * k
+    rotations[:, 0, 2] = -x
+    rotations[:, 1, 0] = -x * y * k
+    rotations[:, 1, 1] = 1 - y * y * k
+    rotations[:, 1, 2] = -y
+    rotations[:, 2, 0] = x
+    rotations[:, 2, 1] = y
+    rotations[:, 2, 2] = n[:, 2]
+
+    rotations[flip, :, 1:] *= -1
+    return rotations
+
+def faces_to_csr(faces):
+    # Packs a list of faces of any sizes into one index buffer, face i being
+    # indices[offsets[i]:offsets[i + 1]]
+    offsets = np.zeros(len(faces) + 1, dtype=np.int64)
+    np.cumsum([len(face) for face in faces], out=offsets[1:])
+    indices = np.fromiter((vert for face in faces for vert in face), dtype=np.int64, count=offsets[-1])
+    return offsets, indices
+
+def flatten_faces(verts, offsets, indices):
+    # Lays every face flat on the xy plane, centered on its centroid, in one
+    # batch. Faces are given in CSR form (see faces_to_csr) and the flattened
+    # vertices come back packed the same way, so face i is
+    # verts_pdf[offsets[i]:offsets[i + 1]].
+    verts = np.asarray(verts, dtype=np.float64)
+    sizes = np.diff(offsets)
+    face_of_vert = np.repeat(np.arange(len(sizes)), sizes)
+
+    face_verts = verts[indices]
+    starts = offsets[:-1]
+    centroids = np.add.reduceat(face_verts, starts)/sizes[:, None]
+    centered = face_verts - centroids[face_of_vert]
+
+    # Newell normal, the sum of the cross products of consecutive corners. It
+    # is exact for flat faces and a best fit plane for generated faces that
+    # are slightly bent.
+    local = np.arange(len(indices)) - starts[face_of_vert]
+    following = np.where(local == sizes[face_of_vert] - 1, starts[face_of_vert], np.arange(len(indices)) + 1)
+    normals = np.add.reduceat(np.cross(centered, centered[following]), starts)
+    normals /= np.linalg.norm(normals, axis=1)[:, None]
+
+    rotations = rotations_to_z(normals)
+
+    verts_pdf = np.einsum("nij,nj->ni", rotations[face_of_vert], centered)
+    return verts_pdf, normals, rotations, centroids
+
+def edge_holes(verts_pdf, offsets, edge_hole_num, remove_corners=False):
+    # Evenly spaced seam holes along every panel edge, for all panels at once.
+    # Panel i gets holes[hole_offsets[i]:hole_offsets[i + 1]]. Edges are walked
+    # closing edge first (last vertex to first), then each edge k from vertex
+    # k + 1 back to vertex k, and both ends of every edge get a hole, so each
+    # corner is punched twice unless remove_corners is set.
+    face_of_vert = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    first = offsets[:-1][face_of_vert]
+    last = offsets[1:][face_of_vert] - 1
+    index = np.arange(len(verts_pdf))
+    closing = index == first
+    edge_start = np.where(closing, last, index)
+    edge_end = np.where(closing, first, index - 1)
+
+    t = np.linspace(0, 1, edge_hole_num)
+    a = verts_pdf[edge_start, :2]
+    b = verts_pdf[edge_end, :2]
+    holes = a[:, None, :] + (b - a)[:, None, :] * t[None, :, None]
+
+    keep = np.full((len(verts_pdf), edge_hole_num), True)
+    if (remove_corners and edge_hole_num > 1):
+        # Every corner is the start of one edge and the end of the edge after
+        # it, so drop one hole of each pair
+        keep[closing, 0] = False
+        keep[~closing, -1] = False
+
+    hole_counts = np.bincount(face_of_vert, weights=keep.sum(axis=1), minlength=len(offsets) - 1)
+    hole_offsets = np.zeros(len(offsets), dtype=np.int64)
+    np.cumsum(hole_counts, out=hole_offsets[1:])
+    return holes[keep], hole_offsets
+
+def lip_outlines(verts_pdf, lip_size):
+    # Push every outline vertex out from its panel center by the lip size
+    vert_lens = np.linalg.norm(verts_pdf, axis=1)
+    return verts_pdf * ((vert_lens + lip_size)/vert_lens)[:, None]
+
+def circle_polygons(centers, radius, segments=16):
+    # Vertices of a segments-sided circle around every center, one polygon per
+    # circle, packed circle after circle
+    angles = np.linspace(0, 2 * math.pi, segments, endpoint=False)
+    ring = np.stack([np.cos(angles), np.sin(angles)], axis=1) * radius
+
+    verts = np.zeros((len(centers), segments, 3))
+    verts[:, :, :2] = centers[:, None, :2] + ring[None, :, :]
+    return verts.reshape(-1, 3), np.full(len(centers), segments, dtype=np.int32)
+
+
+# ------------------------------------------------------------------------
+#    Spherical Arc Panels
+# ------------------------------------------------------------------------
+
+def arc_segments(angles, radius, tolerance):
+    # Fewest chords for each arc that keep every chord within tolerance of
+    # its arc, a chord spanning angle a standing radius * (1 - cos(a/2)) off it
+    step = 2 * math.acos(max(1 - tolerance/radius, -1.0))
+    return np.maximum(np.ceil(angles/step), 1).astype(np.int64)
+
+def flatten_arc_faces(verts, offsets, indices, radius, tolerance):
+    # Flattens panels whose edges are great circle arcs between the corners of
+    # unit sphere faces. Each arc is sampled adaptively (see arc_segments) and
+    # every panel is unrolled about its center with an azimuthal equidistant
+    # projection, which keeps distances from the panel center. Returns the
+    # outlines packed panel after panel like flatten_faces, the outline offset
+    # of each panel, and the offset of each arc's first sample, arc i running
+    # from corner i of the faces to the next corner.
+    sizes = np.diff(offsets)
+    face_of_vert = np.repeat(np.arange(len(sizes)), sizes)
+    starts = offsets[:-1]
+    local = np.arange(len(indices)) - starts[face_of_vert]
+    following = np.where(local == sizes[face_of_vert] - 1, starts[face_of_vert], np.arange(len(indices)) + 1)
+
+    a = verts[indices]
+    b = verts[indices[following]]
+    angles = np.arccos(np.clip(np.einsum("ij,ij->i", a, b), -1, 1))
+
+    counts = arc_segments(angles, radius, tolerance)
+    arc_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=arc_offsets[1:])
+
+    # Spherical interpolation along every arc at once
+    arc = np.repeat(np.arange(len(counts)), counts)
+    t = (np.arange(arc_offsets[-1]) - arc_offsets[:-1][arc])/counts[arc]
+    theta = angles[arc]
+    points = (np.sin((1 - t) * theta)/np.sin(theta))[:, None] * a[arc] + (np.sin(t * theta)/np.sin(theta))[:, None] * b[arc]
+
+    centers = np.add.reduceat(a, starts)
+    centers /= np.linalg.norm(centers, axis=1)[:, None]
+    rotations = rotations_to_z(centers)
+
+    panel = face_of_vert[arc]
+    cos_phi = np.clip(np.einsum("ij,ij->i", points, centers[panel]), -1, 1)
+    tangents = points - cos_phi[:, None] * centers[panel]
+    tangents /= np.linalg.norm(tangents, axis=1)[:, None]
+
+    outlines = np.einsum("nij,nj->ni", rotations[panel], tangents) * (radius * np.arccos(cos_phi))[:, None]
+    outlines[:, 2] = 0
+    return outlines, arc_offsets[offsets], arc_offsets
+
+def arc_holes(outlines, arc_offsets, face_offsets, edge_hole_num, remove_corners=False):
+    # Seam holes spaced evenly by length along every flattened arc, for all
+    # panels at once, in the same layout as edge_holes. Both ends of every
+    # arc get a hole unless remove_corners is set.
+    outline_offsets = arc_offsets[face_offsets]
+    sizes = np.diff(outline_offsets)
+    panel = np.repeat(np.arange(len(sizes)), sizes)
+    index = np.arange(len(outlines))
+    following = np.where(index == outline_offsets[1:][panel] - 1, outline_offsets[:-1][panel], index + 1)
+
+    # Length of the outline up to the start of every segment
+    lengths = np.linalg.norm(outlines[following, :2] - outlines[:, :2], axis=1)
+    before = np.zeros(len(outlines) + 1)
+    np.cumsum(lengths, out=before[1:])
+
+    starts = arc_offsets[:-1]
+    ends = arc_offsets[1:]
+    t = np.linspace(0, 1, edge_hole_num)
+    if (remove_corners and edge_hole_num > 1):
+        t = t[:-1]
+    wanted = before[starts][:, None] + (before[ends] - before[starts])[:, None] * t[None, :]
+
+    segment = np.clip(np.searchsorted(before, wanted, side="right") - 1, starts[:, None], ends[:, None] - 1)
+    fraction = np.clip((wanted - before[segment])/np.maximum(lengths[segment], 1e-12), 0, 1)
+    holes = outlines[segment, :2] + (outlines[following[segment], :2] - outlines[segment, :2]) * fraction[:, :, None]
+
+    hole_offsets = face_offsets * len(t)
+    return holes.reshape(-1, 2), hole_offsets
+
+# ------------------------------------------------------------------------
+#    Layout
+# ------------------------------------------------------------------------
+
+# Extra sheets are laid out to the right of the first one, this far apart (mm)
+SHEET_SPACING = 20.0
+
+def transform_panels(points, offsets, translations, rotations):
+    # Places panel points on the sheet: panel i owns points[offsets[i]:offsets[i + 1]]
+    # and is turned by rotations[i][2] about z, then moved by translations[i]
+    translations = np.asarray(translations, dtype=np.float64)
+    angles = np.asarray(rotations, dtype=np.float64)[:, 2]
+    cos = np.cos(angles)
+    sin = np.sin(angles)
+    matrices = np.stack([np.stack([cos, -sin], axis=1), np.stack([sin, cos], axis=1)], axis=1)
+
+    panel = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    return np.einsum("nij,nj->ni", matrices[panel], points[:, :2]) + translations[panel, :2]
+
+def panel_bounds(points, offsets):
+    # Bounding box corners of every panel
+    starts = offsets[:-1]
+    return np.minimum.reduceat(points[:, :2], starts), np.maximum.reduceat(points[:, :2], starts)
+
+def outline_segments(points, offsets):
+    # Both ends of every edge of every panel outline, (2 * edges, 2), for
+    # drawing them as separate line segments
+    panel = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    index = np.arange(len(points))
+    following = np.where(index == offsets[1:][panel] - 1, offsets[:-1][panel], index + 1)
+    return points[np.stack([index, following], axis=1).ravel(), :2]
+
+def polygon_areas(points, offsets):
+    # Area of every panel outline (shoelace formula)
+    panel = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    index = np.arange(len(points))
+    following = np.where(index == offsets[1:][panel] - 1, offsets[:-1][panel], index + 1)
+    cross = points[:, 0] * points[following, 1] - points[following, 0] * points[:, 1]
+    return np.abs(np.bincount(panel, weights=cross, minlength=len(offsets) - 1))/2
+
+def convex_overlap(a, b, gap=0.0):
+    # Separating axis test for two convex polygons given as (n, 2) corners in
+    # order. True unless some edge normal separates them by at least gap.
+    corners = np.concatenate([a, b])
+    edges = np.concatenate([np.roll(a, -1, axis=0) - a, np.roll(b, -1, axis=0) - b])
+    normals = np.stack([edges[:, 1], -edges[:, 0]], axis=1)
+    normals /= np.linalg.norm(normals, axis=1)[:, None]
+
+    projected_a = a @ normals.T
+    projected_b = b @ normals.T
+    separated = (projected_a.max(axis=0) + gap <= projected_b.min(axis=0)) | (projected_b.max(axis=0) + gap <= projected_a.min(axis=0))
+    return not separated.any()
+
+class GridIndex:
+    # Uniform grid over bounding boxes. query returns every item whose box
+    # shares a cell with the given box, a superset of the boxes it overlaps.
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.items = {}
+
+    def cell_range(self, lo, hi):
+        first = np.floor(np.asarray(lo)/self.cell_size).astype(np.int64)
+        last = np.floor(np.asarray(hi)/self.cell_size).astype(np.int64)
+        return [(x, y) for x in range(first[0], last[0] + 1) for y in range(first[1], last[1] + 1)]
+
+    def insert(self, item, lo, hi):
+        self.remove(item)
+        cells = self.cell_range(lo, hi)
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(item)
+        self.items[item] = cells
+
+    def remove(self, item):
+        for cell in self.items.pop(item, ()):
+            self.cells[cell].discard(item)
+
+    def query(self, lo, hi):
+        found = set()
+        for cell in self.cell_range(lo, hi):
+            found.update(self.cells.get(cell, ()))
+        return found
+
+def edge_normals(shape):
+    # Unit normals of the edges of a polygon given as (n, 2) corners in order
+    edges = np.roll(shape, -1, axis=-2) - shape
+    normals = np.stack([edges[..., 1], -edges[..., 0]], axis=-1)
+    return normals/np.linalg.norm(normals, axis=-1)[..., None]
+
+def blocked_spans(shape, normals, others, other_normals, lines, axis, gap, tolerance=1e-7, candidates=None):
+    # Moving shape by t along the lines t[1 - axis] = lines makes it come
+    # closer than gap to others[j] exactly while t[axis] lies inside the open
+    # span (start, end) (empty when start >= end). Both polygons are convex,
+    # so their edge normals are all the axes a separating axis test needs.
+    # others is (m, v, 2) and other_normals (m, k, 2), padded by repeating
+    # corners and normals. Returns (start, end), each (len(lines), m), or
+    # (len(lines), c) when candidates, (len(lines), c) indices into others,
+    # picks the ones each line is tested against.
+    count = len(others)
+    normals = np.concatenate([np.broadcast_to(normals, (count,) + normals.shape), other_normals], axis=1)
+    axes = normals.transpose(0, 2, 1)
+    projected = shape @ axes
+    projected_others = others @ axes
+    # Edges first from here on, which numpy reduces over fastest
+    low = (projected_others.min(axis=1) - projected.max(axis=1) - gap).T
+    high = (projected_others.max(axis=1) - projected.min(axis=1) + gap).T
+
+    if (candidates is None):
+        candidates = np.broadcast_to(np.arange(count), (len(lines), count))
+    low = low[:, candidates]
+    high = high[:, candidates]
+    along = axes[:, axis].T[:, candidates]
+    across = lines[:, None] * axes[:, 1 - axis].T[:, candidates]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        first = (low - across)/along
+        second = (high - across)/along
+    start = np.minimum(first, second)
+    end = np.maximum(first, second)
+
+    # Axes perpendicular to the lines block all of it or none of it. Shapes
+    # that were placed touching along such an axis count as separated.
+    flat = np.nonzero(np.abs(along) < 1e-12)
+    inside = (low[flat] + tolerance < across[flat]) & (across[flat] < high[flat] - tolerance)
+    start[flat] = np.where(inside, -np.inf, np.inf)
+    end[flat] = np.where(inside, np.inf, -np.inf)
+    return start.max(axis=0), end.min(axis=0)
+
+def convex_overlaps(shape, normals, others, other_normals, gap=0.0):
+    # convex_overlap of shape against every one of others at once, with the
+    # edge normals given and others padded like in blocked_spans. Returns an
+    # (m,) mask.
+    normals = np.concatenate([np.broadcast_to(normals, (len(others),) + normals.shape), other_normals], axis=1)
+    projected = np.einsum("vi,mki->mkv", shape, normals)
+    projected_others = np.einsum("mvi,mki->mkv", others, normals)
+    separated = ((projected.max(axis=2) + gap <= projected_others.min(axis=2)) |
+                 (projected_others.max(axis=2) + gap <= projected.min(axis=2)))
+    return ~separated.any(axis=1)
+
+def lowest_free(start, end, low, high, tolerance=1e-7):
+    # Smallest position in [low, high] outside every blocked span of its line,
+    # NaN for lines without one. The spans of a line are sorted by start and
+    # merged: the free position is where the next span starts past the end of
+    # the spans before it.
+    empty = start >= end
+    start = np.where(empty, np.inf, start)
+    end = np.where(empty, -np.inf, end)
+    order = np.argsort(start, axis=1)
+    start = np.take_along_axis(start, order, axis=1)
+    end = np.take_along_axis(end, order, axis=1)
+
+    reach = np.maximum.accumulate(np.concatenate([np.full((len(start), 1), float(low)), end], axis=1), axis=1)
+    gaps = np.concatenate([start + tolerance >= reach[:, :-1], np.ones((len(start), 1), dtype=bool)], axis=1)
+    lowest = np.take_along_axis(reach, gaps.argmax(axis=1)[:, None], axis=1)[:, 0]
+    return np.where(np.isinf(lowest) | (lowest > high + tolerance), np.nan, np.minimum(lowest, high))
+
+def nest_panels(outlines, offsets, width, height, gap=2.0, rotation_steps=12, columns=48):
+    # Packs convex panel outlines onto a width x height sheet, largest first.
+    # Every panel is dropped down columns evenly spaced lines in each of
+    # rotation_steps rotations, the drop with the lowest top edge is kept and
+    # then slid left and down as far as it goes. Only placed panels inside
+    # the band a drop or slide sweeps, found through a GridIndex, are tested.
+    # Returns (F, 3) translations and rotations, the mask of panels that fit
+    # on the sheet (the rest are parked to its right) and the fraction of the
+    # sheet covered by them.
+    count = len(offsets) - 1
+    areas = polygon_areas(outlines, offsets)
+    angles = np.arange(rotation_steps) * 2 * math.pi/rotation_steps
+    turns = np.stack([np.stack([np.cos(angles), -np.sin(angles)], axis=1), np.stack([np.sin(angles), np.cos(angles)], axis=1)], axis=1)
+    sheet = np.array([width, height], dtype=np.float64)
+
+    translations = np.zeros((count, 3))
+    rotations = np.zeros((count, 3))
+    fitted = np.zeros(count, dtype=bool)
+
+    corner_count = int(np.diff(offsets).max()) if count else 0
+    shapes = np.zeros((count, corner_count, 2))
+    shape_normals = np.zeros((count, corner_count, 2))
+    placed_lo = np.zeros((count, 2))
+    placed_hi = np.zeros((count, 2))
+    placed = []
+
+    # Placed panels by column of grid cells and by band of such columns,
+    # see drop
+    strips = {}
+    bands = {}
+
+    lo, hi = panel_bounds(outlines, offsets)
+    index = GridIndex(max(float(np.mean(hi - lo)), gap, 1e-9) if count else 1.0)
+
+    # Edges are kept gap apart, which holds panels further apart than gap
+    # along x or y near corners: up to gap/cos(a/2) for the sharpest turn a
+    # between two edges of any outline
+    panel = np.repeat(np.arange(count), np.diff(offsets))
+    corner = np.arange(len(outlines))
+    following = np.where(corner == offsets[1:][panel] - 1, offsets[:-1][panel], corner + 1)
+    edges = outlines[following, :2] - outlines[:, :2]
+    edges /= np.linalg.norm(edges, axis=1)[:, None]
+    turn = (edges * edges[following]).sum(axis=1).min() if count else 1.0
+    reach = gap/math.sqrt(max((1 + turn)/2, 1e-6)) + 1e-6
+
+    def slide(shape, normals, position, axis):
+        # Lowest free position along axis, keeping the other coordinate
+        band_lo = position - reach
+        band_hi = position + shape.max(axis=0) + reach
+        band_lo[axis] = -np.inf
+        band_hi[axis] = np.inf
+        near = sorted(index.query(np.maximum(band_lo, 0), np.minimum(band_hi, sheet)))
+        if (not near):
+            return 0.0
+        start, end = blocked_spans(shape, normals, shapes[near], shape_normals[near], position[1 - axis:2 - axis], axis, gap)
+        return lowest_free(start, end, 0.0, position[axis])[0]
+
+    def drop(shape, normals, xs, room):
+        # Lowest free height in every column. Each column is only tested
+        # against the placed panels whose boxes cross the x band it sweeps.
+        # They are found through the index one column of grid cells at a
+        # time, and every band takes the cell columns it covers. Both are
+        # kept until the next panel is placed.
+        band_lo = xs - reach
+        band_hi = xs + shape[:, 0].max() + reach
+        first = np.floor(band_lo/index.cell_size).astype(np.int64)
+        last = np.floor(band_hi/index.cell_size).astype(np.int64)
+        near = []
+        for key in zip(first.tolist(), last.tolist()):
+            if (key not in bands):
+                items = set()
+                for cell in range(key[0], key[1] + 1):
+                    if (cell not in strips):
+                        x = (cell + 0.5) * index.cell_size
+                        strips[cell] = index.query((x, 0.0), (x, height))
+                    items |= strips[cell]
+                bands[key] = np.array(sorted(items), dtype=np.int64)
+            near.append(bands[key])
+
+        candidates = np.full((len(xs), max(len(items) for items in near)), -1, dtype=np.int64)
+        for column, items in enumerate(near):
+            candidates[column, :len(items)] = items
+        valid = candidates >= 0
+        valid &= (placed_lo[candidates, 0] < band_hi[:, None]) & (placed_hi[candidates, 0] > band_lo[:, None])
+        if (not valid.any()):
+            return np.zeros(len(xs))
+
+        # Pack the panels left after the box test to the front of each row
+        order = np.argsort(~valid, axis=1, kind="stable")[:, :valid.sum(axis=1).max()]
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        valid = np.take_along_axis(valid, order, axis=1)
+
+        # Spans are computed against the union of the candidates only
+        union = np.unique(candidates[valid])
+        local = np.searchsorted(union, np.where(valid, candidates, union[0]))
+        start, end = blocked_spans(shape, normals, shapes[union], shape_normals[union], xs, 1, gap, candidates=local)
+        start[~valid] = np.inf
+        end[~valid] = -np.inf
+        return lowest_free(start, end, 0.0, room)
+
+    overflow_y = 0.0
+    for i in np.argsort(-areas, kind="stable"):
+        corners = outlines[offsets[i]:offsets[i + 1], :2]
+        turned = np.einsum("rij,nj->rni", turns, corners)
+        turned -= turned.min(axis=1)[:, None]
+        turned_normals = edge_normals(turned)
+        sizes = turned.max(axis=1)
+
+        best = None
+        for r in range(rotation_steps):
+            room = sheet - sizes[r]
+            if (room[0] < 0 or room[1] < 0):
+                continue
+            xs = np.linspace(0, room[0], columns)
+            if (placed):
+                ys = drop(turned[r], turned_normals[r], xs, room[1])
+            else:
+                ys = np.zeros(columns)
+            if (np.isnan(ys).all()):
+                continue
+            top = ys + sizes[r][1]
+            column = np.nanargmin(top)
+            if (best is None or top[column] < best[0] - 1e-9):
+                best = (top[column], r, np.array([xs[column], ys[column]]))
+
+        if (best is None):
+            # Park panels that do not fit beside the sheet
+            translations[i, 0] = width + gap * 10 - corners[:, 0].min()
+            translations[i, 1] = overflow_y - corners[:, 1].min()
+            overflow_y += np.ptp(corners[:, 1]) + gap
+            continue
+
+        r = best[1]
+        position = best[2]
+        for step in range(2):
+            position[0] = slide(turned[r], turned_normals[r], position, 0)
+            position[1] = slide(turned[r], turned_normals[r], position, 1)
+
+        shape = turned[r] + position
+        shapes[i] = np.concatenate([shape, np.repeat(shape[-1:], corner_count - len(shape), axis=0)])
+        shape_normals[i] = np.concatenate([turned_normals[r], np.repeat(turned_normals[r][-1:], corner_count - len(shape), axis=0)])
+        placed_lo[i] = shape.min(axis=0)
+        placed_hi[i] = shape.max(axis=0)
+        index.insert(i, placed_lo[i], placed_hi[i])
+        placed.append(i)
+        strips.clear()
+        bands.clear()
+
+        translations[i, :2] = shape[0] - turns[r] @ corners[0]
+        rotations[i, 2] = angles[r]
+        fitted[i] = True
+
+    return translations, rotations, fitted, areas[fitted].sum()/(width * height)
+
+def layout_uvs(points, offsets, corners, width, height):
+    # UV of every face corner from the face outlines laid out on the sheets,
+    # corners[i] being the index in points of corner i. Every sheet is a UDIM
+    # tile one unit wide, so u = sheet + x/width and v = y/height.
+    no_holes = np.zeros(len(offsets), dtype=np.int64)
+    pages, page_count, local_points = split_sheets(points, offsets, np.zeros((0, 2)), no_holes, width)[:3]
+    uvs = local_points/(width, height)
+    uvs[:, 0] += np.repeat(pages, np.diff(offsets))
+    return uvs[corners]
+
+def nest_sheets(outlines, offsets, width, height, gap=2.0, rotation_steps=12):
+    # Nests the panels onto as many sheets as they need, sheet k sitting
+    # k * (width + SHEET_SPACING) to the right of the first. Panels too big
+    # for any sheet are parked after the last one with sheet index -1.
+    # Returns translations, rotations, the sheet of every panel and the
+    # fraction of the used sheets covered by panels.
+    count = len(offsets) - 1
+    pitch = width + SHEET_SPACING
+    areas = polygon_areas(outlines, offsets)
+
+    translations = np.zeros((count, 3))
+    rotations = np.zeros((count, 3))
+    sheets = np.full(count, -1, dtype=np.int64)
+
+    remaining = np.arange(count)
+    sheet = 0
+    while (len(remaining)):
+        lengths = np.diff(offsets)[remaining]
+        subset_offsets = np.zeros(len(remaining) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=subset_offsets[1:])
+        subset = outlines[np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in remaining])]
+
+        subset_translations, subset_rotations, fitted = nest_panels(subset, subset_offsets, width, height, gap, rotation_steps)[:3]
+        if (not fitted.any()):
+            # Stack the leftovers past the last sheet
+            subset_translations[:, 0] += sheet * pitch - width - gap * 10
+            translations[remaining] = subset_translations
+            rotations[remaining] = subset_rotations
+            break
+
+        subset_translations[:, 0] += sheet * pitch
+        placed = remaining[fitted]
+        translations[placed] = subset_translations[fitted]
+        rotations[placed] = subset_rotations[fitted]
+        sheets[placed] = sheet
+
+        remaining = remaining[~fitted]
+        sheet += 1
+
+    return translations, rotations, sheets, areas[sheets >= 0].sum()/(max(sheet, 1) * width * height)
+
+def split_sheets(points, offsets, holes, hole_offsets, width):
+    # Splits panels laid out side by side (see nest_sheets) into pages: every
+    # panel goes to the sheet holding the centre of its bounding box, and
+    # used sheets are numbered from 0 without gaps. Returns the page of every
+    # panel, the page count and the points and holes moved onto their page.
+    pitch = width + SHEET_SPACING
+    lo, hi = panel_bounds(points, offsets)
+    sheets = np.maximum(np.floor((lo[:, 0] + hi[:, 0])/2/pitch), 0).astype(np.int64)
+    used, pages = np.unique(sheets, return_inverse=True)
+
+    shift = np.zeros((len(sheets), 2))
+    shift[:, 0] = sheets * pitch
+    local_points = points[:, :2] - np.repeat(shift, np.diff(offsets), axis=0)
+    local_holes = holes[:, :2] - np.repeat(shift, np.diff(hole_offsets), axis=0)
+    return pages.reshape(-1), len(used), local_points, local_holes
+
+class LayoutValidator:
+    # Keeps track of which panels of a layout overlap another panel or do not
+    # lie within a single width x height sheet, sheets sitting side by side as
+    # in nest_sheets. outlines are the convex panel outlines before they are
+    # placed, in the form transform_panels takes. place moves one panel and
+    # only tests it against the panels sharing GridIndex cells with it.
+    def __init__(self, outlines, offsets, width, height, gap=0.0, tolerance=1e-6):
+        self.offsets = offsets
+        self.width = width
+        self.height = height
+        self.pitch = width + SHEET_SPACING
+        self.gap = gap
+        self.tolerance = tolerance
+
+        # Outlines and edge normals padded to the same corner count by
+        # repeating the last one, before and after placing
+        count = len(offsets) - 1
+        corner_count = int(np.diff(offsets).max()) if count else 0
+        self.outlines = np.zeros((count, corner_count, 2))
+        self.normals = np.zeros((count, corner_count, 2))
+        self.corner_counts = np.diff(offsets)
+        for i in range(count):
+            outline = outlines[offsets[i]:offsets[i + 1], :2]
+            padding = corner_count - len(outline)
+            self.outlines[i] = np.concatenate([outline, np.repeat(outline[-1:], padding, axis=0)])
+            normals = edge_normals(outline)
+            self.normals[i] = np.concatenate([normals, np.repeat(normals[-1:], padding, axis=0)])
+        self.shapes = self.outlines.copy()
+        self.shape_normals = self.normals.copy()
+        self.lo = np.zeros((count, 2))
+        self.hi = np.zeros((count, 2))
+
+        # x, y and angle every panel was last placed at, NaN before that
+        self.placements = np.full((count, 3), np.nan)
+
+        lo, hi = panel_bounds(outlines, offsets) if count else (np.zeros((0, 2)), np.ones((0, 2)))
+        self.index = GridIndex(max(float(np.mean(hi - lo)), 1e-9) if count else 1.0)
+
+        # Panels each panel overlaps, whether it is off its sheet and every
+        # panel with either problem
+        self.overlaps = [set() for outline in self.outlines]
+        self.outside = np.zeros(len(self.outlines), dtype=bool)
+        self.invalid = set()
+
+    def place_all(self, translations, rotations):
+        for panel in range(len(self.outlines)):
+            self.place(panel, translations[panel], rotations[panel][2])
+
+    def place(self, panel, translation, angle):
+        # Moves panel to translation (x, y, ...) turned by angle about z and
+        # returns the panels whose overlaps may have changed, panel included
+        cos = math.cos(angle)
+        sin = math.sin(angle)
+        turn = np.array([[cos, sin], [-sin, cos]])
+        shape = self.outlines[panel] @ turn + (translation[0], translation[1])
+        normals = self.normals[panel] @ turn
+        lo = shape.min(axis=0)
+        hi = shape.max(axis=0)
+        self.placements[panel] = (translation[0], translation[1], angle)
+        self.shapes[panel] = shape
+        self.shape_normals[panel] = normals
+        self.lo[panel] = lo
+        self.hi[panel] = hi
+        self.index.insert(panel, lo, hi)
+
+        previous = self.overlaps[panel]
+        for other in previous:
+            self.overlaps[other].discard(panel)
+
+        # Exact test of the neighbours whose boxes overlap
+        near = self.index.query(lo, hi)
+        near.discard(panel)
+        near = np.array(sorted(near), dtype=np.int64)
+        if (len(near)):
+            near = near[(lo < self.hi[near]).all(axis=1) & (self.lo[near] < hi).all(axis=1)]
+        if (len(near)):
+            near = near[convex_overlaps(shape, normals, self.shapes[near], self.shape_normals[near], self.gap)]
+        overlaps = set(near.tolist())
+        for other in overlaps:
+            self.overlaps[other].add(panel)
+        self.overlaps[panel] = overlaps
+
+        # The sheet holding the middle of the panel, like split_sheets
+        sheet = max(math.floor((lo[0] + hi[0])/2/self.pitch), 0)
+        left = sheet * self.pitch
+        self.outside[panel] = (lo[0] < left - self.tolerance or hi[0] > left + self.width + self.tolerance or
+                               lo[1] < -self.tolerance or hi[1] > self.height + self.tolerance)
+
+        touched = previous | overlaps
+        touched.add(panel)
+        for other in touched:
+            if (self.outside[other] or self.overlaps[other]):
+                self.invalid.add(other)
+            else:
+                self.invalid.discard(other)
+        return touched
+
+    def invalid_outlines(self):
+        # Placed outlines of the invalid panels, in the form transform_panels
+        # returns, and their offsets
+        panels = sorted(self.invalid)
+        offsets = np.zeros(len(panels) + 1, dtype=np.int64)
+        np.cumsum(self.corner_counts[panels], out=offsets[1:])
+        points = np.concatenate([self.shapes[panel, :self.corner_counts[panel]] for panel in panels]) if panels else np.zeros((0, 2))
+        return points, offsets
@@ -4,11 +4,18 @@ from bpy.props import StringProperty, BoolProperty
 from bpy_extras.io_utils import ImportHelper, ExportHelper
 from bpy.types import Operator
 import math
+import time
+import threading
 import numpy as np
 import mathutils
-import bmesh
+import gpu
+from gpu_extras.batch import batch_for_shader
 
 ball_module = bpy.data.texts["ball.py"].as_module()
+profiler = ball_module.profiler
+export = ball_module.export
+geometry = ball_module.geometry
+mesh_pool = ball_module.mesh_pool
 
 # ------------------------------------------------------------------------
 #    Global Object Creation
@@ -35,120 +42,611 @@ ball_loaded = False
 
 def update_ball(self, context):
     if ((ball is not None) and ball_loaded):
-        # Remove old object
-        for obj in ball_collection.objects:
-            bpy.data.objects.remove(obj, do_unlink=True)
-
         # Make any needed modifications to mesh
-        ball.update_radius(bpy.context.scene.sbd_radius)
+        with profiler.stage("update_radius"):
+            ball.update_radius(bpy.context.scene.sbd_radius)
+
+        # The pooled mesh is overwritten in place
+        with profiler.stage("get_mesh"):
+            mesh = ball.get_mesh()
 
-        # make object from mesh
-        new_object = bpy.data.objects.new('soccer_ball', ball.get_mesh())
-        # add object to scene collection
-        ball_collection.objects.link(new_object)
+        # The object only changes when it is not showing that mesh any more
+        objects = list(ball_collection.objects)
+        if (len(objects) != 1 or objects[0].data != mesh):
+            # Remove old object
+            with profiler.stage("remove_ball_object"):
+                for obj in objects:
+                    bpy.data.objects.remove(obj, do_unlink=True)
+
+            # make object from mesh
+            new_object = bpy.data.objects.new('soccer_ball', mesh)
+            # add object to scene collection
+            ball_collection.objects.link(new_object)
 
 
         update_pdf(self, context)
 
+# Scene properties each part of the PDF preview is built from. update_pdf
+# only rewrites the parts whose properties changed since they were built.
+pdf_dependencies = {
+    "face": ("sbd_radius",),
+    "lip": ("sbd_radius", "sbd_panel_lip_size"),
+    "hole": ("sbd_radius", "sbd_edge_hole_num", "sbd_panel_hole_size"),
+    "sheet": ("sbd_radius", "sbd_pdf_width", "sbd_pdf_height"),
+    "layout": ("sbd_radius",),
+}
+
+# Property values each part was last built from
+pdf_built = {}
+
+# Ball and panel count the preview objects were made for
+pdf_topology = None
+
+# Parts left stale during an interactive burst of updates (see scheduling)
+pdf_deferred_parts = ()
+
+def invalidate_pdf(*parts):
+    for part in parts:
+        pdf_built.pop(part, None)
+
+def pdf_objects_valid():
+    # Every registered preview object still exists, deleted ones read as None
+    scene = bpy.context.scene
+    if (scene.sbd_pdf_sheet is None):
+        return False
+    for entry in scene.sbd_panels:
+        if (entry.face is None or entry.lip is None or entry.hole is None):
+            return False
+    return True
+
+def remove_pdf_objects():
+    global pdf_topology
+
+    # Remove old object
+    for obj in pdf_collection.objects:
+        bpy.data.objects.remove(obj, do_unlink=True)
+
+    for col in pdf_collection.children:
+        for obj in col.objects:
+            bpy.data.objects.remove(obj, do_unlink=True)
+        bpy.data.collections.remove(col, do_unlink=True)
+
+    bpy.context.scene.sbd_panels.clear()
+    bpy.context.scene.sbd_pdf_sheet = None
+    pdf_topology = None
+    pdf_built.clear()
+
+def release_pdf_meshes(start=0, stop=None):
+    # Frees the pooled preview meshes of panels start to stop, and the sheet
+    # mesh with all of them
+    for part in ("face", "lip", "hole"):
+        mesh_pool.release(part, start, stop)
+    if (start == 0 and stop is None):
+        mesh_pool.release("sheet")
+
+def create_panel_objects(index):
+    # Face, lip and hole objects of one panel, in their own collection
+    # Make the pdf face collection object
+    soccer_ball_pdf_collection = bpy.data.collections.new("soccer_ball_pdf_" + str(index))
+
+    # make object from mesh
+    new_face = bpy.data.objects.new("pdf_face_" + str(index), mesh_pool.get("face", index))
+
+    # Create face lip
+    new_lip = bpy.data.objects.new("pdf_lip_" + str(index), mesh_pool.get("lip", index))
+    new_lip.display_type = 'WIRE'
+
+    # Create face holes
+    new_hole = bpy.data.objects.new("pdf_hole_" + str(index), mesh_pool.get("hole", index))
+
+    for obj in (new_face, new_lip, new_hole):
+        obj.lock_location = (False, False, True)
+        obj.lock_rotation = (True, True, False)
+        soccer_ball_pdf_collection.objects.link(obj)
+
+    pdf_collection.children.link(soccer_ball_pdf_collection)
+    return new_face, new_lip, new_hole
+
+def create_pdf_objects():
+    global pdf_topology
+    remove_pdf_objects()
+
+    # Entry i of the registry holds the objects of panel i
+    panels = bpy.context.scene.sbd_panels
+    count = 0
+    while (count < ball.panel_count):
+        entry = panels.add()
+        entry.face, entry.lip, entry.hole = create_panel_objects(count)
+        count += 1
+
+    new_pdf = bpy.data.objects.new("soccer_ball_pdf", mesh_pool.get("sheet"))
+    new_pdf.display_type = 'WIRE'
+    new_pdf.lock_location = (True, True, True)
+    new_pdf.lock_rotation = (True, True, True)
+    pdf_collection.objects.link(new_pdf)
+    bpy.context.scene.sbd_pdf_sheet = new_pdf
+
+    # Meshes of panels a previous ball had beyond this one's
+    release_pdf_meshes(ball.panel_count)
+    pdf_topology = (id(ball), ball.panel_count)
+
+def uv_mesh(operator):
+    # The ball mesh UVs can be written to, None while the ball is in edit
+    # mode, where leaving edit mode would overwrite them
+    for obj in ball_collection.objects:
+        if (obj.mode == 'EDIT'):
+            operator.report({'WARNING'}, "UVs not mapped, the ball is in edit mode")
+            return None
+        return obj.data
+    return None
+
+def place_panel_objects(index, objects):
+    translation = mathutils.Vector((ball.pdf_translations[index][0] + (ball.radius * 2), ball.pdf_translations[index][1], ball.pdf_translations[index][2]))
+    rotation = mathutils.Vector((ball.pdf_rotations[index][0], ball.pdf_rotations[index][1], ball.pdf_rotations[index][2]))
+
+    for obj in objects:
+        obj.location = translation
+        obj.rotation_euler = rotation
+
+def update_pdf_layout():
+    count = 0
+    for entry in bpy.context.scene.sbd_panels:
+        place_panel_objects(count, (entry.face, entry.lip, entry.hole))
+        count += 1
+
+# ------------------------------------------------------------------------
+#    GPU Overlay
+# ------------------------------------------------------------------------
+
+# The overlay preview draws every panel of the sheet from a few line and
+# point batches instead of three objects per panel. The batches are uploaded
+# from the draw callback, and only after the geometry they hold changed.
+# One panel at a time can be edited as real objects, the overlay leaves it out.
+
+# Primitive and colour each part is drawn with
+OVERLAY_PARTS = {
+    "sheet": ('LINES', (0.6, 0.6, 0.6, 1.0)),
+    "face": ('LINES', (0.9, 0.9, 0.9, 1.0)),
+    "lip": ('LINES', (0.2, 0.6, 1.0, 1.0)),
+    "hole": ('POINTS', (1.0, 0.35, 0.2, 1.0)),
+    "invalid": ('LINES', (1.0, 0.1, 0.1, 1.0)),
+}
+
+# Coordinates waiting to be uploaded, and the uploaded batches, by part
+overlay_pending = {}
+overlay_batches = {}
+
+overlay_handler = None
+overlay_shader = None
+
+# Ball and panel count the overlay was drawn for
+overlay_topology = None
+
+# Panel being edited as objects, and its face, lip and hole objects
+edit_panel = None
+edit_objects = ()
+
+def draw_overlay():
+    global overlay_shader
+    if (overlay_shader is None):
+        overlay_shader = gpu.shader.from_builtin('UNIFORM_COLOR' if bpy.app.version >= (3, 4, 0) else '3D_UNIFORM_COLOR')
+
+    for part, coords in overlay_pending.items():
+        if (len(coords)):
+            overlay_batches[part] = batch_for_shader(overlay_shader, OVERLAY_PARTS[part][0], {"pos": coords})
+        else:
+            overlay_batches.pop(part, None)
+    overlay_pending.clear()
+
+    gpu.state.point_size_set(4.0)
+    overlay_shader.bind()
+    for part, batch in overlay_batches.items():
+        overlay_shader.uniform_float("color", OVERLAY_PARTS[part][1])
+        batch.draw(overlay_shader)
+    gpu.state.point_size_set(1.0)
+
+def update_overlay(parts):
+    hidden = () if edit_panel is None else (edit_panel,)
+    for part in parts:
+        set_overlay_part(part, ball.overlay_coords(part, hidden))
+
+def set_overlay_part(part, coords):
+    global overlay_handler
+
+    overlay_pending[part] = coords
+    if (overlay_handler is None):
+        overlay_handler = bpy.types.SpaceView3D.draw_handler_add(draw_overlay, (), 'WINDOW', 'POST_VIEW')
+    redraw_view3d()
+
+def remove_overlay():
+    global overlay_handler
+    global overlay_topology
+    global edit_panel
+    global edit_objects
+
+    if (overlay_handler is not None):
+        bpy.types.SpaceView3D.draw_handler_remove(overlay_handler, 'WINDOW')
+        overlay_handler = None
+        redraw_view3d()
+    overlay_pending.clear()
+    overlay_batches.clear()
+    overlay_topology = None
+
+    # The edit objects go with the rest of pdf_collection
+    edit_panel = None
+    edit_objects = ()
+    pdf_built.clear()
+
+def edit_objects_valid():
+    try:
+        for obj in edit_objects:
+            obj.name
+    except ReferenceError:
+        return False
+    return len(edit_objects) > 0
+
+def apply_panel_edit():
+    # Saves where the edited panel's objects were moved to
+    if (edit_panel is not None and edit_objects_valid()):
+        translations, rotations = ball_module.objects_layout(edit_objects[:1], ball.radius * 2)
+        ball.pdf_translations[edit_panel] = translations[0]
+        ball.pdf_rotations[edit_panel] = rotations[0]
+
+def end_panel_edit():
+    global edit_panel
+    global edit_objects
+
+    for obj in edit_objects:
+        try:
+            bpy.data.objects.remove(obj, do_unlink=True)
+        except ReferenceError:
+            pass
+    if (edit_panel is not None):
+        collection = pdf_collection.children.get("soccer_ball_pdf_" + str(edit_panel))
+        if (collection is not None and not collection.objects):
+            bpy.data.collections.remove(collection)
+        release_pdf_meshes(edit_panel, edit_panel + 1)
+    edit_panel = None
+    edit_objects = ()
+
+def begin_panel_edit(index):
+    global edit_panel
+    global edit_objects
+
+    end_panel_edit()
+    edit_panel = index
+    edit_objects = create_panel_objects(index)
+    for part, obj in zip(("face", "lip", "hole"), edit_objects):
+        ball.fill_pdf_meshes(part, [obj.data], index)
+    place_panel_objects(index, edit_objects)
+
 def update_pdf(self, context):
     if ((ball is not None) and ball_loaded):
-        
-        ball.set_pdf_options(bpy.context.scene.sbd_pdf_width, bpy.context.scene.sbd_pdf_height, bpy.context.scene.sbd_panel_lip_size, bpy.context.scene.sbd_edge_hole_num, bpy.context.scene.sbd_panel_hole_size)
-        ball.update_pdf_mesh()
-        pdf_faces_mesh, pdf_lips_mesh, pdf_holes_mesh, pdf_mesh = ball.get_pdf_mesh()
+        scene = bpy.context.scene
+
+        ball.set_pdf_options(scene.sbd_pdf_width, scene.sbd_pdf_height, scene.sbd_panel_lip_size, scene.sbd_edge_hole_num, scene.sbd_panel_hole_size)
+
+        if (not scene.sbd_pdf_display):
+            apply_panel_edit()
+            with profiler.stage("remove_pdf_objects"):
+                remove_pdf_objects()
+                remove_overlay()
+                release_pdf_meshes()
+            remove_validator()
+            return
+
+        if (scene.sbd_pdf_preview == 'OVERLAY'):
+            update_pdf_overlay(scene)
+            return
+
+        # Leaving the overlay keeps the edited panel where it was moved to
+        if (overlay_topology is not None):
+            apply_panel_edit()
+            remove_overlay()
+            invalidate_pdf("layout")
+
+        # Objects are only recreated when the panels themselves change
+        if (pdf_topology != (id(ball), ball.panel_count) or not pdf_objects_valid()):
+            with profiler.stage("create_pdf_objects"):
+                create_pdf_objects()
+
+        changed = changed_pdf_parts(scene)
+
+        if ("face" in changed):
+            with profiler.stage("update_pdf_mesh"):
+                ball.update_pdf_mesh()
+
+        for part in ("face", "lip", "hole"):
+            if (part in changed):
+                ball.fill_pdf_meshes(part, [getattr(entry, part).data for entry in scene.sbd_panels])
+
+        # The layout decides how many sheets are drawn
+        if ("sheet" in changed or "layout" in changed):
+            with profiler.stage("fill_sheet"):
+                ball.fill_pdf_sheet_mesh(scene.sbd_pdf_sheet.data)
+
+        if ("layout" in changed):
+            with profiler.stage("update_pdf_layout"):
+                update_pdf_layout()
+
+        pdf_built.update(changed)
+        update_validator(changed)
+
+def changed_pdf_parts(scene):
+    # Property values of the parts that need rebuilding, by part
+    changed = {}
+    for part, props in pdf_dependencies.items():
+        values = tuple(getattr(scene, prop) for prop in props)
+        if (pdf_built.get(part) != values and part not in pdf_deferred_parts):
+            changed[part] = values
+    return changed
+
+def update_pdf_overlay(scene):
+    global overlay_topology
+
+    # Starts over from a new ball, or from the object preview
+    if (overlay_topology != (id(ball), ball.panel_count)):
+        with profiler.stage("remove_pdf_objects"):
+            remove_pdf_objects()
+            remove_overlay()
+            release_pdf_meshes()
+        overlay_topology = (id(ball), ball.panel_count)
+    if (edit_panel is not None and not edit_objects_valid()):
+        end_panel_edit()
+        invalidate_pdf("layout")
+
+    changed = changed_pdf_parts(scene)
+
+    if ("face" in changed):
+        with profiler.stage("update_pdf_mesh"):
+            ball.update_pdf_mesh()
+
+    # Every part moves with the layout, stale holes stay put while deferred.
+    # The invalid highlight is not a ball part, highlight_invalid draws it.
+    parts = [part for part in ("sheet", "face", "lip", "hole") if part in changed or ("layout" in changed and part not in pdf_deferred_parts)]
+    if (parts):
+        with profiler.stage("update_overlay"):
+            update_overlay(parts)
+
+    if (edit_panel is not None):
+        for part, obj in zip(("face", "lip", "hole"), edit_objects):
+            if (part in changed):
+                ball.fill_pdf_meshes(part, [obj.data], edit_panel)
+        if ("layout" in changed):
+            place_panel_objects(edit_panel, edit_objects)
+
+    pdf_built.update(changed)
+    update_validator(changed)
 
-        # Remove old object
-        for obj in pdf_collection.objects:
-            bpy.data.objects.remove(obj, do_unlink=True)
+# ------------------------------------------------------------------------
+#    Layout Validation
+# ------------------------------------------------------------------------
 
-        for col in pdf_collection.children:
-            for obj in col.objects:
-                bpy.data.objects.remove(obj, do_unlink=True)
-            bpy.data.collections.remove(col, do_unlink=True)
-
-        if (bpy.context.scene.sbd_pdf_display):
-            count = 0
-            while (count < len(pdf_faces_mesh)):
-                # Make the pdf face collection object
-                soccer_ball_pdf_collection = bpy.data.collections.new("soccer_ball_pdf_" + str(count))
-
-                translation = mathutils.Vector((ball.pdf_translations[count][0] + (ball.radius * 2), ball.pdf_translations[count][1], ball.pdf_translations[count][2]))
-                rotation = mathutils.Vector((ball.pdf_rotations[count][0], ball.pdf_rotations[count][1], ball.pdf_rotations[count][2]))
-
-                # make object from mesh
-                new_face = bpy.data.objects.new("pdf_face_" + str(count), pdf_faces_mesh[count])
-                new_face.lock_location = (False, False, True)
-                new_face.lock_rotation = (True, True, False)
-                new_face.location = translation
-                new_face.rotation_euler = rotation
-
-                soccer_ball_pdf_collection.objects.link(new_face)
-
-                # Create face lip
-                new_lip = bpy.data.objects.new("pdf_lip_" + str(count), pdf_lips_mesh[count])
-                new_lip.display_type = 'WIRE'
-                new_lip.lock_location = (False, False, True)
-                new_lip.lock_rotation = (True, True, False)
-                new_lip.location = translation
-                new_lip.rotation_euler = rotation
-
-                soccer_ball_pdf_collection.objects.link(new_lip)
-
-                mesh = bpy.data.meshes.new("pdf_hole_" + str(count))
-                obj = bpy.data.objects.new("pdf_hole_" + str(count), mesh)
-                obj.lock_location = (False, False, True)
-                obj.lock_rotation = (True, True, False)
-                obj.location = translation
-                obj.rotation_euler = rotation
-
-                soccer_ball_pdf_collection.objects.link(obj)
-
-                # Create face holes
-                hole_count = 0
-                while hole_count < len(pdf_holes_mesh[count]):
-                    #new bmesh
-                    bm = bmesh.new()
-                    # load in a mesh
-                    bm.from_mesh(mesh)
-                    # create circle
-                    geom = bmesh.ops.create_circle(bm, segments=16, radius=ball.panel_hole_size)
-
-                    verts = geom["verts"]
-
-                    bm.faces.new(verts)
-
-                    bmesh.ops.translate(         # Translate
-                        bm,
-                        verts=verts,
-                        vec=(pdf_holes_mesh[count][hole_count][0], pdf_holes_mesh[count][hole_count][1], 0))
-
-                    # write back to mesh
-                    bm.to_mesh(mesh)
-
-                    hole_count+=1
-
-                pdf_collection.children.link(soccer_ball_pdf_collection)
-                count += 1
-
-            new_pdf = bpy.data.objects.new("soccer_ball_pdf", pdf_mesh)
-            new_pdf.display_type = 'WIRE'
-            new_pdf.lock_location = (True, True, True)
-            new_pdf.lock_rotation = (True, True, True)
-            pdf_collection.objects.link(new_pdf)
+# Panels whose lip outline overlaps another one or leaves its sheet are drawn
+# red. A geometry.LayoutValidator is built whenever the lips, sheets or layout
+# are rebuilt, and a depsgraph handler re-tests only the panels that moved.
+
+validator = None
+
+# Lip object of every validated panel, and the panel of every preview object
+validator_lips = {}
+panel_lookup = {}
+
+# Whether the validator waits for the end of an interactive burst of updates
+validator_stale = False
+
+def layout_validator(scene):
+    # A validator of the layout the cutting pattern would be exported from,
+    # with the lip outlines where the lip objects are
+    translations = ball.pdf_translations
+    rotations = ball.pdf_rotations
+    if (pdf_objects_valid() and len(scene.sbd_panels) == ball.panel_count):
+        translations, rotations = ball_module.objects_layout([entry.lip for entry in scene.sbd_panels], ball.radius * 2)
+    else:
+        apply_panel_edit()
+
+    checker = geometry.LayoutValidator(ball.get_pdf_lip_verts(), ball.pdf_offsets, scene.sbd_pdf_width, scene.sbd_pdf_height)
+    checker.place_all(translations, rotations)
+    return checker
+
+def rebuild_validator():
+    global validator
+    global validator_stale
+
+    scene = bpy.context.scene
+    with profiler.stage("validate_layout"):
+        validator = layout_validator(scene)
+    validator_stale = False
+
+    validator_lips.clear()
+    panel_lookup.clear()
+    if (edit_panel is not None and edit_objects_valid()):
+        validator_lips[edit_panel] = edit_objects[1]
+        for obj in edit_objects:
+            panel_lookup[obj] = edit_panel
+    elif (overlay_topology is None):
+        count = 0
+        for entry in scene.sbd_panels:
+            validator_lips[count] = entry.lip
+            for obj in (entry.face, entry.lip, entry.hole):
+                panel_lookup[obj] = count
+            count += 1
+    highlight_invalid()
+
+def update_validator(changed):
+    # Called by update_pdf with the parts it rebuilt
+    global validator
+    global validator_stale
+
+    if ("lip" in changed or "sheet" in changed or "layout" in changed):
+        validator = None
+        validator_stale = True
+    if (validator_stale and not pdf_deferred_parts):
+        rebuild_validator()
+
+def remove_validator():
+    global validator
+    validator = None
+    validator_lips.clear()
+    panel_lookup.clear()
+    overlay_pending.pop("invalid", None)
+    overlay_batches.pop("invalid", None)
+
+def highlight_invalid():
+    points, offsets = validator.invalid_outlines()
+    coords = np.zeros((2 * len(points), 3), dtype=np.float32)
+    coords[:, :2] = geometry.outline_segments(points, offsets)
+    coords[:, 0] += ball.radius * 2
+    set_overlay_part("invalid", coords)
+
+def validate_moved_panels(scene, depsgraph):
+    # depsgraph_update_post handler: re-tests the panels whose objects moved
+    if (validator is None or not panel_lookup):
+        return
+
+    moved = set()
+    for update in depsgraph.updates:
+        if (update.is_updated_transform):
+            panel = panel_lookup.get(update.id.original)
+            if (panel is not None):
+                moved.add(panel)
+
+    changed = False
+    sheet_x = ball.radius * 2
+    for panel in moved:
+        try:
+            obj = validator_lips[panel]
+            placement = (obj.location.x - sheet_x, obj.location.y, obj.rotation_euler.z)
+        except ReferenceError:
+            continue
+        # Objects placed by update_pdf are already where the validator has them
+        if (np.allclose(placement, validator.placements[panel], rtol=0.0, atol=1e-9)):
+            continue
+        invalid = panel in validator.invalid
+        validator.place(panel, placement, placement[2])
+        changed = changed or invalid or panel in validator.invalid
+
+    if (changed):
+        highlight_invalid()
+
+# ------------------------------------------------------------------------
+#    Update Scheduling
+# ------------------------------------------------------------------------
+
+# Dragging a slider fires its update callback for every intermediate value.
+# The callbacks only record what needs rebuilding, and a timer runs at most
+# one rebuild per frame budget, always from the latest property values.
+# While the radius is being dragged the hole meshes are left stale, and once
+# updates stop for SETTLE_TIME one final rebuild brings every part up to date.
+
+FRAME_BUDGET = 1/30
+SETTLE_TIME = 0.2
+
+# None, "pdf" or "ball" (a ball rebuild includes the pdf)
+scheduled_update = None
+scheduled_at = 0.0
+last_rebuild_at = 0.0
+
+def schedule_update(kind):
+    global scheduled_update
+    global scheduled_at
+
+    if (scheduled_update != "ball"):
+        scheduled_update = kind
+    scheduled_at = time.perf_counter()
+
+    if (not bpy.app.timers.is_registered(run_scheduled_update)):
+        bpy.app.timers.register(run_scheduled_update, first_interval=0.0)
+
+def cancel_scheduled_update():
+    global scheduled_update
+    scheduled_update = None
+    if (bpy.app.timers.is_registered(run_scheduled_update)):
+        bpy.app.timers.unregister(run_scheduled_update)
+
+def run_scheduled_update():
+    global scheduled_update
+    global last_rebuild_at
+    global pdf_deferred_parts
+
+    now = time.perf_counter()
+    settled = now - scheduled_at >= SETTLE_TIME
+
+    if (scheduled_update is None and not settled):
+        return FRAME_BUDGET
+    if (scheduled_update is not None and now - last_rebuild_at < FRAME_BUDGET and not settled):
+        return FRAME_BUDGET - (now - last_rebuild_at)
+
+    # With nothing scheduled, settling catches up the pdf parts a ball
+    # rebuild deferred
+    kind = scheduled_update or "pdf"
+    scheduled_update = None
+    pdf_deferred_parts = ("hole",) if (kind == "ball" and not settled) else ()
+    try:
+        with profiler.rebuild(kind):
+            if (kind == "ball"):
+                update_ball(None, bpy.context)
+            else:
+                update_pdf(None, bpy.context)
+    finally:
+        pdf_deferred_parts = ()
+        last_rebuild_at = time.perf_counter()
+    if (profiler.enabled):
+        redraw_view3d()
+
+    if (settled):
+        return None
+    return FRAME_BUDGET
+
+def redraw_view3d():
+    # The sidebar and the overlay only redraw by themselves on mouse movement
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if (area.type == 'VIEW_3D'):
+                area.tag_redraw()
+
+def schedule_ball_update(self, context):
+    schedule_update("ball")
+
+def schedule_pdf_update(self, context):
+    schedule_update("pdf")
 
 # ------------------------------------------------------------------------
 #    Properties
 # ------------------------------------------------------------------------
 
-bpy.types.Scene.sbd_radius = bpy.props.FloatProperty(name="Radius", update=update_ball, default=115, min=1, max=500)
+bpy.types.Scene.sbd_radius = bpy.props.FloatProperty(name="Radius", update=schedule_ball_update, default=115, min=1, max=500)
+
+bpy.types.Scene.sbd_panel_lip_size = bpy.props.FloatProperty(name="Panel Lip Size", update=schedule_pdf_update, default=115, min=0)
+bpy.types.Scene.sbd_edge_hole_num = bpy.props.FloatProperty(name="Edge Hole Num", update=schedule_pdf_update, default=115, min=0)
+bpy.types.Scene.sbd_panel_hole_size = bpy.props.FloatProperty(name="Panel Hole Size", update=schedule_pdf_update, default=115, min=0)
 
-bpy.types.Scene.sbd_panel_lip_size = bpy.props.FloatProperty(name="Panel Lip Size", update=update_pdf, default=115, min=0)
-bpy.types.Scene.sbd_edge_hole_num = bpy.props.FloatProperty(name="Edge Hole Num", update=update_pdf, default=115, min=0)
-bpy.types.Scene.sbd_panel_hole_size = bpy.props.FloatProperty(name="Panel Hole Size", update=update_pdf, default=115, min=0)
+bpy.types.Scene.sbd_polyhedron_kind = bpy.props.EnumProperty(name="Polyhedron", items=[('GOLDBERG', "Goldberg", "Goldberg polyhedron, 10 * frequency^2 + 2 panels"), ('TRUNCATED', "Truncated Icosahedron", "Subdivided truncated icosahedron, 30 * frequency^2 + 2 panels")], default='GOLDBERG')
+bpy.types.Scene.sbd_polyhedron_frequency = bpy.props.IntProperty(name="Frequency", default=3, min=1, max=64)
+bpy.types.Scene.sbd_arc_tolerance = bpy.props.FloatProperty(name="Arc Tolerance", description="Largest gap in mm between a curved seam and its chords", default=0.1, min=0.001)
 
-bpy.types.Scene.sbd_pdf_display = bpy.props.BoolProperty(name="Pdf Display", update=update_pdf, default=False)
-bpy.types.Scene.sbd_pdf_width = bpy.props.FloatProperty(name="Pdf Width", update=update_pdf, default=500, min=10)
-bpy.types.Scene.sbd_pdf_height = bpy.props.FloatProperty(name="Pdf Height", update=update_pdf, default=500, min=10)
+bpy.types.Scene.sbd_pdf_display = bpy.props.BoolProperty(name="Pdf Display", update=schedule_pdf_update, default=False)
+bpy.types.Scene.sbd_pdf_preview = bpy.props.EnumProperty(name="Preview", update=schedule_pdf_update, items=[('OBJECTS', "Objects", "Three objects per panel, every panel can be moved"), ('OVERLAY', "GPU Overlay", "Draw the panels in the viewport, one panel at a time is edited as objects")], default='OBJECTS')
+bpy.types.Scene.sbd_edit_panel = bpy.props.IntProperty(name="Panel", description="Panel to edit as objects in the overlay preview", default=0, min=0)
+bpy.types.Scene.sbd_pdf_sheet = bpy.props.PointerProperty(name="Pdf Sheet", type=bpy.types.Object)
+bpy.types.Scene.sbd_pdf_width = bpy.props.FloatProperty(name="Pdf Width", update=schedule_pdf_update, default=500, min=10)
+bpy.types.Scene.sbd_pdf_height = bpy.props.FloatProperty(name="Pdf Height", update=schedule_pdf_update, default=500, min=10)
+
+def update_profiler(self, context):
+    profiler.enabled = context.scene.sbd_profile_enabled
+    profiler.use_cprofile = context.scene.sbd_profile_cprofile
+
+bpy.types.Scene.sbd_show_profile = bpy.props.BoolProperty(name="Profiling", default=False)
+bpy.types.Scene.sbd_profile_enabled = bpy.props.BoolProperty(name="Record Rebuilds", description="Time every stage of the last rebuilds", update=update_profiler, default=False)
+bpy.types.Scene.sbd_profile_cprofile = bpy.props.BoolProperty(name="cProfile", description="Also run recorded rebuilds under cProfile", update=update_profiler, default=False)
+
+class SBDPanelObjects(bpy.types.PropertyGroup):
+    # Preview objects of one panel. Scene.sbd_panels holds one entry per
+    # panel in panel order, so the registry is saved with the .blend and
+    # does not depend on object names.
+    face: bpy.props.PointerProperty(name="Face", type=bpy.types.Object)
+    lip: bpy.props.PointerProperty(name="Lip", type=bpy.types.Object)
+    hole: bpy.props.PointerProperty(name="Hole", type=bpy.types.Object)
 
 # ------------------------------------------------------------------------
 #    Operators
@@ -158,10 +656,17 @@ class CreateBallOperator(Operator):
     bl_idname = "sbd.create_ball_operator"
     bl_label = "Create Ball Operator"
 
+    ball_type: bpy.props.EnumProperty(items=[('CLASSIC', "Classic", ""), ('POLYHEDRON', "Polyhedron", ""), ('SPHERICAL_ARC', "Spherical Arc", "")], default='CLASSIC')
+
     def execute(self, context):
         global ball
         global ball_loaded
-        ball = ball_module.ClassicBall()
+        if (self.ball_type == 'POLYHEDRON'):
+            ball = ball_module.PolyhedronBall(context.scene.sbd_polyhedron_kind.lower(), context.scene.sbd_polyhedron_frequency)
+        elif (self.ball_type == 'SPHERICAL_ARC'):
+            ball = ball_module.SphericalArcBall(context.scene.sbd_polyhedron_kind.lower(), context.scene.sbd_polyhedron_frequency, context.scene.sbd_arc_tolerance)
+        else:
+            ball = ball_module.ClassicBall()
 
         ball_loaded = False
 
@@ -173,28 +678,188 @@ class CreateBallOperator(Operator):
 
         ball_loaded = True
 
-        update_ball(self, context)
+        with profiler.rebuild("create"):
+            with profiler.stage("remove_pdf_objects"):
+                remove_pdf_objects()
+            update_ball(self, context)
+        cancel_scheduled_update()
         return {'FINISHED'}
     
-class SaveBallOperator(Operator):
+class SaveBallOperator(Operator, ExportHelper):
+    """Save the ball, its settings and its panel layout to a design file"""
     bl_idname = "sbd.save_ball_operator"
-    bl_label = "Save Ball Operator"
+    bl_label = "Save Ball"
+
+    filename_ext = ".sbd"
+    filter_glob: bpy.props.StringProperty(default="*.sbd", options={'HIDDEN'}, maxlen=255)
+
+    def execute(self, context):
+        if ((ball is None) or (not ball_loaded)):
+            self.report({'WARNING'}, "Create a ball first")
+            return {'CANCELLED'}
+
+        scene = context.scene
+        ball.set_pdf_options(scene.sbd_pdf_width, scene.sbd_pdf_height, scene.sbd_panel_lip_size, scene.sbd_edge_hole_num, scene.sbd_panel_hole_size)
+        ball.save_ball(self.filepath)
+        return {'FINISHED'}
+
+class ImportBallOperator(Operator, ImportHelper):
+    """Open a ball saved with Save Soccer Ball"""
+    bl_idname = "sbd.import_ball_operator"
+    bl_label = "Import Ball"
+
+    filename_ext = ".sbd"
+    filter_glob: bpy.props.StringProperty(default="*.sbd", options={'HIDDEN'}, maxlen=255)
 
     def execute(self, context):
+        global ball
+        global ball_loaded
+
+        try:
+            new_ball = ball_module.load_ball(self.filepath)
+        except (OSError, ValueError) as error:
+            self.report({'ERROR'}, str(error))
+            return {'CANCELLED'}
+
+        ball = new_ball
+        ball_loaded = False
+
+        scene = context.scene
+        scene.sbd_radius = ball.radius
+        scene.sbd_panel_lip_size = ball.panel_lip_size
+        scene.sbd_edge_hole_num = ball.edge_hole_num
+        scene.sbd_panel_hole_size = ball.panel_hole_size
+        if (ball.pdf_width is not None):
+            scene.sbd_pdf_width = ball.pdf_width
+            scene.sbd_pdf_height = ball.pdf_height
+
+        ball_loaded = True
+
+        with profiler.rebuild("import"):
+            with profiler.stage("remove_pdf_objects"):
+                remove_pdf_objects()
+            update_ball(self, context)
+        cancel_scheduled_update()
         return {'FINISHED'}
     
+class ExportJob:
+    # Writes a cutting pattern on a worker thread. The pattern is a snapshot
+    # of plain arrays taken on the main thread, so the writer never touches
+    # Blender data and the scene can be edited meanwhile.
+    def __init__(self, file_path, pattern):
+        self.file_path = file_path
+        self.pattern = pattern
+        self.page = 0
+        self.file_paths = None
+        self.error = None
+        self.cancelled = threading.Event()
+        self.start = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def page_written(self, page, page_count, seconds):
+        self.page = page + 1
+        if (self.cancelled.is_set()):
+            raise export.ExportCancelled()
+
+    def run(self):
+        try:
+            self.file_paths = export.write_pattern(self.file_path, self.pattern, self.page_written)
+        except export.ExportCancelled:
+            pass
+        except Exception as error:
+            self.error = error
+
+# The export being written, one at a time
+export_job = None
+
 class ExportBallOperator(Operator, ExportHelper):
-    """This appears in the tooltip of the operator and in the generated docs"""
+    """Write the cutting pattern in the background, Esc cancels it"""
     bl_idname = "sbd.export_ball_operator"
     bl_label = "Export Ball Operator"
 
     # ExportHelper mixin class uses this
     filename_ext = ".pdf"
-    filter_glob: bpy.props.StringProperty(default="*.pdf", options={'HIDDEN'}, maxlen=255)
+    filter_glob: bpy.props.StringProperty(default="*.pdf;*.svg;*.dxf", options={'HIDDEN'}, maxlen=255)
+
+    file_format: bpy.props.EnumProperty(name="Format", items=[('PDF', "PDF", "One page per sheet"), ('SVG', "SVG", "One file per sheet"), ('DXF', "DXF", "One file per sheet, AutoCAD R12")], default='PDF')
+
+    def check(self, context):
+        # Keeps the file name's extension in step with the chosen format
+        self.filename_ext = "." + self.file_format.lower()
+        return super().check(context)
 
     def execute(self, context):
-        if ball is not None:
-            ball.export_ball(context, self.filepath, pdf_collection)
+        global export_job
+        if ((ball is None) or (not ball_loaded)):
+            self.report({'WARNING'}, "Create a ball first")
+            return {'CANCELLED'}
+        if (export_job is not None):
+            self.report({'WARNING'}, "An export is still being written")
+            return {'CANCELLED'}
+
+        scene = context.scene
+        ball.set_pdf_options(scene.sbd_pdf_width, scene.sbd_pdf_height, scene.sbd_panel_lip_size, scene.sbd_edge_hole_num, scene.sbd_panel_hole_size)
+
+        # The preview highlights the problems, a hidden one is only checked
+        ball.update_pdf_mesh()
+        if (scene.sbd_pdf_display):
+            rebuild_validator()
+            checker = validator
+        else:
+            checker = layout_validator(scene)
+        if (checker.invalid):
+            panels = sorted(checker.invalid)
+            self.report({'ERROR'}, "Not exported, panels %s%s overlap or leave the sheet" % (", ".join(str(panel) for panel in panels[:10]), "..." if len(panels) > 10 else ""))
+            return {'CANCELLED'}
+
+        # Everything the writer needs is copied out of the scene here
+        file_path = bpy.path.ensure_ext(os.path.splitext(self.filepath)[0], "." + self.file_format.lower())
+        if (pdf_objects_valid() and len(scene.sbd_panels) == ball.panel_count):
+            pattern = ball.export_pattern(scene.sbd_panels, uv_mesh(self))
+        else:
+            # The overlay and a hidden preview export the saved layout
+            apply_panel_edit()
+            pattern = ball.export_pattern(None, uv_mesh(self))
+
+        export_job = ExportJob(file_path, pattern)
+        self.timer = context.window_manager.event_timer_add(0.1, window=context.window)
+        context.window_manager.modal_handler_add(self)
+        self.show_progress(context)
+        return {'RUNNING_MODAL'}
+
+    def show_progress(self, context):
+        text = "Exporting %s: sheet %d/%d" % (os.path.basename(export_job.file_path), export_job.page, export_job.pattern.page_count)
+        if (export_job.cancelled.is_set()):
+            text += ", cancelling"
+        else:
+            text += ", Esc to cancel"
+        context.workspace.status_text_set(text)
+
+    def modal(self, context, event):
+        global export_job
+        if (event.type == 'ESC' and event.value == 'PRESS'):
+            export_job.cancelled.set()
+            self.show_progress(context)
+            return {'RUNNING_MODAL'}
+
+        if (export_job.thread.is_alive()):
+            if (event.type == 'TIMER'):
+                self.show_progress(context)
+            return {'PASS_THROUGH'}
+
+        job = export_job
+        export_job = None
+        context.window_manager.event_timer_remove(self.timer)
+        context.workspace.status_text_set(None)
+
+        if (job.error is not None):
+            self.report({'ERROR'}, "Export failed: %s" % job.error)
+            return {'CANCELLED'}
+        if (job.file_paths is None):
+            self.report({'WARNING'}, "Export cancelled")
+            return {'CANCELLED'}
+        self.report({'INFO'}, "%d sheets written to %s in %.1f s" % (job.pattern.page_count, ", ".join(job.file_paths), time.perf_counter() - job.start))
         return {'FINISHED'}
 
 class SavePdfLayoutOperator(Operator):
@@ -202,22 +867,152 @@ class SavePdfLayoutOperator(Operator):
     bl_label = "Save PDF Layout Operator"
 
     def execute(self, context):
-        translations = []
-        rotations = []
+        if (overlay_topology is not None):
+            # Only the edited panel can have moved
+            apply_panel_edit()
+            invalidate_pdf("layout")
+            update_pdf(self, context)
+            return {'FINISHED'}
+
+        panels = context.scene.sbd_panels
+        if (not pdf_objects_valid() or len(panels) != ball.panel_count):
+            self.report({'WARNING'}, "Show the pdf preview objects first")
+            return {'CANCELLED'}
+
+        with profiler.rebuild("layout"):
+            with profiler.stage("read_layout"):
+                translations, rotations = ball_module.objects_layout([entry.face for entry in panels], ball.radius * 2)
+
+            ball.update_pdf_translations(translations)
+            ball.update_pdf_rotations(rotations)
+            invalidate_pdf("layout")
+            update_pdf(self, context)
+        return {'FINISHED'}
 
-        count = 0
-        for face in ball.faces:
-            obj = pdf_collection.children["soccer_ball_pdf_" + str(count)].objects["pdf_face_" + str(count)]
-            translations.append(np.array([obj.location[0] - (ball.radius * 2), obj.location[1], obj.location[2]]))
-            rotations.append(np.array([0.0, 0.0, obj.rotation_euler[2]]))
-            count+=1
-
-        ball.update_pdf_translations(translations)
-        ball.update_pdf_rotations(rotations)
+class EditPanelOperator(Operator):
+    """Turn one panel of the overlay preview into objects that can be moved and rotated"""
+    bl_idname = "sbd.edit_panel_operator"
+    bl_label = "Edit Panel"
+
+    def execute(self, context):
+        scene = context.scene
+        if ((ball is None) or (not ball_loaded) or overlay_topology is None):
+            self.report({'WARNING'}, "Show the pdf as a GPU overlay first")
+            return {'CANCELLED'}
+        if (scene.sbd_edit_panel >= ball.panel_count):
+            self.report({'WARNING'}, "The ball has %d panels" % ball.panel_count)
+            return {'CANCELLED'}
+
+        apply_panel_edit()
+        begin_panel_edit(scene.sbd_edit_panel)
+        update_overlay(("face", "lip", "hole"))
+        rebuild_validator()
+
+        for obj in context.selected_objects:
+            obj.select_set(False)
+        edit_objects[0].select_set(True)
+        context.view_layer.objects.active = edit_objects[0]
+        return {'FINISHED'}
+
+class FinishPanelEditOperator(Operator):
+    """Save where the edited panel was moved to and draw it with the overlay again"""
+    bl_idname = "sbd.finish_panel_edit_operator"
+    bl_label = "Finish Panel Edit"
+
+    def execute(self, context):
+        if (edit_panel is None):
+            return {'CANCELLED'}
+
+        apply_panel_edit()
+        end_panel_edit()
+        invalidate_pdf("layout")
         update_pdf(self, context)
         return {'FINISHED'}
+
+class MapUVsOperator(Operator):
+    """Map the ball's UVs to where its panels lie on the sheets, one UDIM tile per sheet"""
+    bl_idname = "sbd.map_uvs_operator"
+    bl_label = "Map Panel UVs"
+
+    def execute(self, context):
+        if ((ball is None) or (not ball_loaded)):
+            self.report({'WARNING'}, "Create a ball first")
+            return {'CANCELLED'}
+
+        mesh = uv_mesh(self)
+        if (mesh is None):
+            return {'CANCELLED'}
+
+        scene = context.scene
+        ball.set_pdf_options(scene.sbd_pdf_width, scene.sbd_pdf_height, scene.sbd_panel_lip_size, scene.sbd_edge_hole_num, scene.sbd_panel_hole_size)
+        ball.update_pdf_mesh()
+
+        # Panels moved in the preview count even before the layout is saved
+        if (pdf_objects_valid() and len(scene.sbd_panels) == ball.panel_count):
+            ball.map_uvs(mesh, *ball_module.objects_layout([entry.face for entry in scene.sbd_panels], ball.radius * 2))
+        else:
+            apply_panel_edit()
+            ball.map_uvs(mesh)
+        return {'FINISHED'}
+
+class NestPanelsOperator(Operator):
+    bl_idname = "sbd.nest_panels_operator"
+    bl_label = "Nest Panels Operator"
+
+    def execute(self, context):
+        if ((ball is None) or (not ball_loaded)):
+            self.report({'WARNING'}, "Create a ball first")
+            return {'CANCELLED'}
+
+        scene = context.scene
+        ball.set_pdf_options(scene.sbd_pdf_width, scene.sbd_pdf_height, scene.sbd_panel_lip_size, scene.sbd_edge_hole_num, scene.sbd_panel_hole_size)
+        with profiler.rebuild("nest"):
+            ball.update_pdf_mesh()
+
+            with profiler.stage("nest_panels"):
+                sheets, oversized, utilisation = ball.nest_panels()
+            invalidate_pdf("layout")
+            update_pdf(self, context)
+
+        if (oversized):
+            self.report({'WARNING'}, "%d panels are larger than the sheet" % oversized)
+        else:
+            self.report({'INFO'}, "Panels nested on %d sheets (%.0f%% used)" % (sheets, utilisation * 100))
+        return {'FINISHED'}
     
 
+class ExportProfileOperator(Operator, ExportHelper):
+    """Write the recorded rebuild timings to JSON"""
+    bl_idname = "sbd.export_profile_operator"
+    bl_label = "Export Profile"
+
+    filename_ext = ".json"
+    filter_glob: bpy.props.StringProperty(default="*.json", options={'HIDDEN'}, maxlen=255)
+
+    def execute(self, context):
+        profiler.write_json(self.filepath)
+        return {'FINISHED'}
+
+class ExportCProfileOperator(Operator, ExportHelper):
+    """Write the cProfile statistics of the recorded rebuilds, for pstats or snakeviz"""
+    bl_idname = "sbd.export_cprofile_operator"
+    bl_label = "Export cProfile"
+
+    filename_ext = ".prof"
+    filter_glob: bpy.props.StringProperty(default="*.prof", options={'HIDDEN'}, maxlen=255)
+
+    def execute(self, context):
+        profiler.write_cprofile(self.filepath)
+        return {'FINISHED'}
+
+class ClearProfileOperator(Operator):
+    bl_idname = "sbd.clear_profile_operator"
+    bl_label = "Clear Profile"
+
+    def execute(self, context):
+        profiler.clear()
+        return {'FINISHED'}
+
 class LoadFileOperator(Operator, ImportHelper):
 
     bl_idname = "sbd.load_file_operator"
@@ -263,12 +1058,15 @@ class SBDPanel(bpy.types.Panel):
         layout.label(text="Geometry Creation:")
 
         col = layout.column(align=True)
-        col.operator(CreateBallOperator.bl_idname, text="Import Soccer Ball", icon="IMPORT")
+        col.operator(ImportBallOperator.bl_idname, text="Import Soccer Ball", icon="IMPORT")
         layout.separator()
         col = layout.column(align=True)
-        col.operator(CreateBallOperator.bl_idname, text="Create Classic Ball", icon="MESH_UVSPHERE")
-        col.operator(CreateBallOperator.bl_idname, text="Create Polyhedron Ball", icon="MESH_ICOSPHERE")
-        col.operator(CreateBallOperator.bl_idname, text="Create Spherical Arc Ball", icon="SPHERE")
+        col.operator(CreateBallOperator.bl_idname, text="Create Classic Ball", icon="MESH_UVSPHERE").ball_type = 'CLASSIC'
+        col.prop(context.scene, 'sbd_polyhedron_kind', text="")
+        col.prop(context.scene, 'sbd_polyhedron_frequency')
+        col.operator(CreateBallOperator.bl_idname, text="Create Polyhedron Ball", icon="MESH_ICOSPHERE").ball_type = 'POLYHEDRON'
+        col.prop(context.scene, 'sbd_arc_tolerance')
+        col.operator(CreateBallOperator.bl_idname, text="Create Spherical Arc Ball", icon="SPHERE").ball_type = 'SPHERICAL_ARC'
 
         layout.separator()
 
@@ -282,11 +1080,19 @@ class SBDPanel(bpy.types.Panel):
         layout.label(text="Export:")
         col = layout.column(align=True)
         col.prop(context.scene, 'sbd_pdf_display')
+        col.prop(context.scene, 'sbd_pdf_preview', text="")
+        if (context.scene.sbd_pdf_preview == 'OVERLAY'):
+            row = col.row(align=True)
+            row.prop(context.scene, 'sbd_edit_panel')
+            row.operator(EditPanelOperator.bl_idname, text="", icon="OBJECT_DATAMODE")
+            row.operator(FinishPanelEditOperator.bl_idname, text="", icon="CHECKMARK")
 
         layout.separator()
         col = layout.column(align=True)
 
         col.operator(SavePdfLayoutOperator.bl_idname, text="Save Pdf Layout", icon="EDITMODE_HLT")
+        col.operator(NestPanelsOperator.bl_idname, text="Nest Panels", icon="MOD_ARRAY")
+        col.operator(MapUVsOperator.bl_idname, text="Map Panel UVs", icon="UV")
 
         layout.separator()
         col = layout.column(align=True)
@@ -306,21 +1112,64 @@ class SBDPanel(bpy.types.Panel):
         col = layout.column(align=True)
 
         col.operator(SaveBallOperator.bl_idname, text="Save Soccer Ball", icon="EXPORT")
-        col.operator(ExportBallOperator.bl_idname, text="Export Soccer Ball PDF", icon="EXPORT")
+        col.operator(ExportBallOperator.bl_idname, text="Export Cutting Pattern", icon="EXPORT")
 
         layout.separator()
 
+        scene = context.scene
+        layout.prop(scene, 'sbd_show_profile', icon="TRIA_DOWN" if scene.sbd_show_profile else "TRIA_RIGHT", emboss=False)
+        if (scene.sbd_show_profile):
+            self.draw_profile(layout, scene)
+
+    def draw_profile(self, layout, scene):
+        col = layout.column(align=True)
+        col.prop(scene, 'sbd_profile_enabled')
+        col.prop(scene, 'sbd_profile_cprofile')
+
+        record = profiler.last()
+        if (record is not None):
+            box = layout.box()
+            col = box.column(align=True)
+            col.label(text="Last %s rebuild: %.1f ms" % (record["kind"], record["ms"]))
+            averages = profiler.averages()
+            for name, stage in sorted(record["stages"].items(), key=lambda item: -item[1]["ms"]):
+                col.label(text="%s: %.1f ms x%d (avg %.1f)" % (name, stage["ms"], stage["calls"], averages.get(name, 0.0)))
+            col.label(text="%d objects, %d meshes" % (record["objects"], record["meshes"]))
+
+        stats = ball_module.geometry_cache.stats()
+        layout.label(text="Cache: %d hits, %d misses, %.1f MB" % (stats["hits"], stats["misses"], stats["bytes"]/(1024 * 1024)))
+        stats = mesh_pool.stats()
+        layout.label(text="Mesh pool: %d meshes, %d created, %d reused" % (stats["meshes"], stats["created"], stats["reused"]))
+
+        col = layout.column(align=True)
+        col.operator(ExportProfileOperator.bl_idname, text="Export Profile JSON", icon="EXPORT")
+        col.operator(ExportCProfileOperator.bl_idname, text="Export cProfile Stats", icon="EXPORT")
+        col.operator(ClearProfileOperator.bl_idname, text="Clear Profile", icon="TRASH")
+
 # ------------------------------------------------------------------------
 #    Blender Setup
 # ------------------------------------------------------------------------
 
-classes = [SBDPanel, LoadFileOperator, CreateBallOperator, SaveBallOperator, ExportBallOperator, SavePdfLayoutOperator]
+classes = [SBDPanelObjects, SBDPanel, LoadFileOperator, CreateBallOperator, SaveBallOperator, ImportBallOperator, ExportBallOperator, SavePdfLayoutOperator, NestPanelsOperator, MapUVsOperator,
+           EditPanelOperator, FinishPanelEditOperator,
+           ExportProfileOperator, ExportCProfileOperator, ClearProfileOperator]
 
 def register():
     for cls in classes:
         bpy.utils.register_class(cls)
+    bpy.types.Scene.sbd_panels = bpy.props.CollectionProperty(type=SBDPanelObjects)
+
+    # Running the script again replaces the handler of the last run
+    handlers = bpy.app.handlers.depsgraph_update_post
+    for handler in [handler for handler in handlers if getattr(handler, "__name__", "") == validate_moved_panels.__name__]:
+        handlers.remove(handler)
+    handlers.append(validate_moved_panels)
 
 def unregister():
+    if (validate_moved_panels in bpy.app.handlers.depsgraph_update_post):
+        bpy.app.handlers.depsgraph_update_post.remove(validate_moved_panels)
+    remove_overlay()
+    del bpy.types.Scene.sbd_panels
     for cls in classes:
         bpy.utils.unregister_class(cls)
 
@@ -0,0 +1,80 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import design
+import geometry
+
+PARAMS = {"type": "PolyhedronBall", "kind": "goldberg", "frequency": 3, "radius": 115.0, "tolerance": 0.1,
+          "lip": 3.0, "hole_num": 9.0, "hole_size": 1.0, "pdf_width": 500.0, "pdf_height": 420.0}
+
+def ball_arrays():
+    # The arrays SoccerBall.save_ball writes, plus a few odd ones
+    verts, offsets, indices = geometry.polyhedron("goldberg", 3)
+    rng = np.random.default_rng(3)
+    return {
+        "unit_verts": verts,
+        "face_offsets": offsets,
+        "face_indices": indices,
+        "pdf_translations": rng.uniform(0, 500, (len(offsets) - 1, 3)),
+        "pdf_rotations": rng.uniform(0, 6, (len(offsets) - 1, 3)),
+        "small": np.arange(7, dtype=np.float32),
+        "every_other": np.arange(20, dtype=np.int32).reshape(10, 2)[::2],
+        "empty": np.zeros((0, 2), dtype=np.int64),
+    }
+
+def assert_same_arrays(loaded, arrays):
+    assert list(loaded) == list(arrays)
+    for name, array in arrays.items():
+        assert loaded[name].dtype == array.dtype, name
+        assert loaded[name].shape == array.shape, name
+        np.testing.assert_array_equal(loaded[name], array)
+
+def test_round_trip(tmp_path):
+    file_path = str(tmp_path / "ball.sbd")
+    arrays = ball_arrays()
+    design.save_design(file_path, PARAMS, arrays)
+
+    params, loaded = design.load_design(file_path)
+    assert params == PARAMS
+    assert_same_arrays(loaded, arrays)
+    assert not loaded["unit_verts"].flags.writeable
+
+def test_save_over_loaded_file(tmp_path):
+    # The loaded arrays are views of the mapped file being replaced
+    file_path = str(tmp_path / "ball.sbd")
+    arrays = ball_arrays()
+    design.save_design(file_path, PARAMS, arrays)
+    params, loaded = design.load_design(file_path)
+
+    changed = dict(loaded)
+    changed["pdf_translations"] = loaded["pdf_translations"] + 1
+    del changed["small"]
+    params["radius"] = 90.0
+    design.save_design(file_path, params, changed)
+    design.save_design(file_path, params, changed)
+
+    # The old views still read the old file
+    assert_same_arrays(loaded, arrays)
+
+    params_again, loaded_again = design.load_design(file_path)
+    assert params_again == params
+    assert_same_arrays(loaded_again, changed)
+    assert os.listdir(tmp_path) == ["ball.sbd"]
+
+def test_rejects_wrong_magic(tmp_path):
+    file_path = str(tmp_path / "ball.sbd")
+    design.save_design(file_path, PARAMS, ball_arrays())
+    with open(file_path, "r+b") as f:
+        f.write(b"PDF-")
+    with pytest.raises(ValueError):
+        design.load_design(file_path)
+
+    with open(file_path, "wb") as f:
+        f.write(design.MAGIC)
+    with pytest.raises(ValueError):
+        design.load_design(file_path)
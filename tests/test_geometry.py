@@ -0,0 +1,138 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geometry
+
+# ------------------------------------------------------------------------
+#    Reference
+# ------------------------------------------------------------------------
+
+def reference_edge_holes(verts, edge_hole_num):
+    # The per-edge loop SoccerBall.get_pdf_mesh used before edge_holes, for
+    # one panel whose outline is verts
+    holes = []
+    face = list(range(len(verts)))
+    first_vert = np.array(verts[face[0]])
+    last_vert = np.array(verts[face[-1]])
+
+    edge = first_vert - last_vert
+    step = np.linalg.norm(edge)/(int(edge_hole_num)-1)
+    for i in range(int(edge_hole_num)):
+        wanted = i * step
+        scale = wanted/np.linalg.norm(edge)
+
+        holes.append((edge*scale) + last_vert)
+
+    count = 0
+    while count < len(face) - 1:
+        first_vert = np.array(verts[face[count]])
+        last_vert = np.array(verts[face[count + 1]])
+
+        edge = first_vert - last_vert
+
+        step = np.linalg.norm(edge)/(int(edge_hole_num)-1)
+        for i in range(int(edge_hole_num)):
+            wanted = i * step
+            scale = wanted/np.linalg.norm(edge)
+
+            holes.append((edge*scale) + last_vert)
+        count+=1
+
+    return np.array(holes)
+
+def brute_force_problems(outlines, offsets, placements, width, height, tolerance=1e-6):
+    # Every overlapping pair and every panel off its sheet, testing each pair
+    # of placed panels with convex_overlap
+    translations = np.zeros((len(placements), 3))
+    translations[:, :2] = placements[:, :2]
+    rotations = np.zeros((len(placements), 3))
+    rotations[:, 2] = placements[:, 2]
+    points = geometry.transform_panels(outlines, offsets, translations, rotations)
+    shapes = [points[offsets[i]:offsets[i + 1], :2] for i in range(len(offsets) - 1)]
+
+    pairs = set()
+    for i in range(len(shapes)):
+        for j in range(i + 1, len(shapes)):
+            if (geometry.convex_overlap(shapes[i], shapes[j])):
+                pairs.add((i, j))
+
+    pitch = width + geometry.SHEET_SPACING
+    outside = set()
+    for i, shape in enumerate(shapes):
+        lo = shape.min(axis=0)
+        hi = shape.max(axis=0)
+        left = max(np.floor((lo[0] + hi[0])/2/pitch), 0) * pitch
+        if (lo[0] < left - tolerance or hi[0] > left + width + tolerance or lo[1] < -tolerance or hi[1] > height + tolerance):
+            outside.add(i)
+    return pairs, outside
+
+def classic_lips(radius=115, lip=3):
+    # Lip outlines of the ClassicBall panels and their offsets
+    verts, offsets, indices = geometry.polyhedron("classic", 1)
+    verts_pdf = geometry.flatten_faces(verts, offsets, indices)[0] * radius
+    return geometry.lip_outlines(verts_pdf, lip), offsets
+
+# ------------------------------------------------------------------------
+#    Tests
+# ------------------------------------------------------------------------
+
+@pytest.mark.parametrize("edge_hole_num", [2, 5, 9])
+def test_edge_holes_match_per_edge_loop(edge_hole_num):
+    # ClassicBall panels at the default radius
+    verts, offsets, indices = geometry.polyhedron("classic", 1)
+    verts_pdf = geometry.flatten_faces(verts, offsets, indices)[0] * 115
+
+    holes, hole_offsets = geometry.edge_holes(verts_pdf, offsets, edge_hole_num)
+
+    assert len(hole_offsets) == len(offsets)
+    for i in range(len(offsets) - 1):
+        expected = reference_edge_holes(verts_pdf[offsets[i]:offsets[i + 1]], edge_hole_num)
+        panel_holes = holes[hole_offsets[i]:hole_offsets[i + 1]]
+        assert panel_holes.shape == (len(expected), 2)
+        np.testing.assert_allclose(panel_holes, expected[:, :2], rtol=0, atol=1e-9)
+
+def test_nested_classic_ball_is_valid():
+    outlines, offsets = classic_lips()
+    translations, rotations, sheets = geometry.nest_sheets(outlines, offsets, 500, 500)[:3]
+    assert (sheets >= 0).all()
+
+    validator = geometry.LayoutValidator(outlines, offsets, 500, 500)
+    validator.place_all(translations, rotations)
+    assert validator.invalid == set()
+    assert not validator.outside.any()
+
+def test_layout_validator_matches_brute_force():
+    width = height = 500
+    outlines, offsets = classic_lips()
+    translations, rotations = geometry.nest_sheets(outlines, offsets, width, height)[:2]
+    validator = geometry.LayoutValidator(outlines, offsets, width, height)
+    validator.place_all(translations, rotations)
+
+    # Drag panels about: anywhere around the sheets, or onto another panel
+    rng = np.random.default_rng(7)
+    count = len(offsets) - 1
+    seen_overlap = seen_outside = False
+    for move in range(60):
+        panel = int(rng.integers(count))
+        if (move % 2):
+            other = int(rng.integers(count))
+            translation = validator.placements[other, :2] + rng.uniform(-40, 40, 2)
+        else:
+            translation = rng.uniform((-60, -60), (2 * (width + geometry.SHEET_SPACING) + 60, height + 60))
+        validator.place(panel, translation, rng.uniform(0, 2 * np.pi))
+
+        pairs, outside = brute_force_problems(outlines, offsets, validator.placements, width, height)
+        # Both panels of a pair list each other
+        flagged = {(i, j) for i in range(count) for j in validator.overlaps[i]}
+        assert flagged == pairs | {(j, i) for i, j in pairs}
+        assert set(np.flatnonzero(validator.outside).tolist()) == outside
+        assert validator.invalid == {i for pair in pairs for i in pair} | outside
+        seen_overlap |= bool(pairs)
+        seen_outside |= bool(outside)
+
+    assert seen_overlap and seen_outside